@@ -0,0 +1,299 @@
+#! /usr/bin/env python
+
+"""
+usage: bench.py [name ...]
+
+Runs checkergen micro-benchmarks and prints their results. Runs all
+benchmarks if no names are given. Benchmarks that need optional modules
+which are not installed are skipped.
+"""
+
+import sys
+sys.path.append('src')
+import time
+from decimal import Decimal
+
+def timed(func, *args):
+    """Returns best wall time in seconds of a few calls to func."""
+    best = None
+    for n in range(3):
+        start = time.time()
+        func(*args)
+        elapsed = time.time() - start
+        if best == None or elapsed < best:
+            best = elapsed
+    return best
+
+def bench_mesh():
+    """Compares quad-per-cell and shared-vertex grid meshes."""
+    import geometry
+    if not geometry.available:
+        print 'skipped: NumPy not available'
+        return
+    init_unit = (Decimal(30), Decimal(30))
+    end_unit = (Decimal(50), Decimal(50))
+    position = (Decimal(0), Decimal(0))
+    loc = (1, 1)
+    print 'dims'.rjust(10), 'mesh'.rjust(6), 'vertices'.rjust(10),\
+        'indices'.rjust(10), 'bytes'.rjust(10), 'ms'.rjust(8)
+    for n in [10, 100, 300]:
+        dims = (n, n)
+        def quad():
+            verts = geometry.board_verts(dims, init_unit, end_unit,
+                                         position, loc)
+            indices = geometry.board_indices(dims)
+            cols = geometry.board_cols(dims, ((0,)*3, (255,)*3))
+            return verts, indices, cols
+        def grid():
+            bounds = geometry.grid_bounds(dims, init_unit, end_unit,
+                                          position, loc)
+            verts = geometry.grid_verts(bounds)
+            indices = geometry.grid_indices(dims)
+            cols = geometry.grid_cols(dims, ((0,)*3, (255,)*3), loc)
+            return verts, indices, cols
+        sizes = []
+        for name, func in [('quad', quad), ('grid', grid)]:
+            verts, indices, cols = func()
+            # v2f vertices, c3B colors and GLuint indices in the batch
+            nbytes = verts.nbytes + cols[0].nbytes + indices.nbytes
+            sizes.append((len(verts) // 2, nbytes))
+            print '{0}x{0}'.format(n).rjust(10), name.rjust(6),\
+                str(len(verts) // 2).rjust(10), str(len(indices)).rjust(10),\
+                str(nbytes).rjust(10),\
+                '{0:.2f}'.format(timed(func) * 1000).rjust(8)
+        print 'grid saves {0:.1%} of vertices, {1:.1%} of memory'.\
+            format(1 - sizes[1][0] / float(sizes[0][0]),
+                   1 - sizes[1][1] / float(sizes[0][1]))
+
+def bench_timeline():
+    """Compares per-frame Decimal bookkeeping with compiled schedules."""
+    import timeline
+    from utils import to_decimal
+    cross = [(Decimal(0), True), (Decimal('0.5'), False), (Decimal(2), True)]
+    cross_times = (Decimal('0.75'), Decimal('0.25'))
+    print 'fps'.rjust(6), 'decimal us/frame'.rjust(18),\
+        'compiled us/frame'.rjust(18), 'compile ms'.rjust(12)
+    for fps in [Decimal(60), Decimal(144), Decimal(240)]:
+        n = int(10 * fps)
+        def decimal_frames():
+            show = True
+            for count in range(n):
+                time = to_decimal(count) / fps
+                if time in dict(cross):
+                    show = dict(cross)[time]
+                col = (count % (sum(cross_times) * fps) <
+                       cross_times[0] * fps)
+        def compile_frames():
+            changes = timeline.cross_frames(cross, n, fps)
+            crosses = timeline.CrossColors(cross_times, fps)
+            return changes, crosses
+        changes, crosses = compile_frames()
+        def compiled_frames():
+            show = True
+            for count, change in enumerate(changes):
+                if change != None:
+                    show = change
+                col = crosses.index(count)
+        print str(fps).rjust(6),\
+            '{0:.2f}'.format(timed(decimal_frames) / n * 1e6).rjust(18),\
+            '{0:.2f}'.format(timed(compiled_frames) / n * 1e6).rjust(18),\
+            '{0:.2f}'.format(timed(compile_frames) * 1000).rjust(12)
+
+def bench_group():
+    """Compares per-shape, group-level and scheduled phase updates."""
+    import timeline
+    if not timeline.available:
+        print 'skipped: NumPy not available'
+        return
+    fps = Decimal(60)
+    freqs = [Decimal(f) for f in ['1', '2.5', '6', '7.5', '10', '12', '15']]
+    n = 600
+    print 'shapes'.rjust(8), 'per-shape us/frame'.rjust(20),\
+        'group us/frame'.rjust(16), 'scheduled us/frame'.rjust(20)
+    for size in [4, 16, 64, 128, 256, 512]:
+        phases = [timeline.Phase(Decimal(45 * k % 360), freqs[k % len(freqs)],
+                                 fps) for k in range(size)]
+        state = timeline.GroupState(phases, fpst=2)
+        def per_shape():
+            for count in range(n):
+                bits = [p.bit(count) for p in phases]
+                flipped = [p.flipped(count) for p in phases]
+                flips = [p.flips(count) for p in phases]
+                sids = tuple([k for k, f in enumerate(flipped)
+                              if f and flips[k] % 2 == 0])
+        def group():
+            for count in range(n):
+                state.seek(count)
+        def scheduled():
+            state.seek(0)
+            for count in range(1, n):
+                state.advance(count)
+        print str(size).rjust(8),\
+            '{0:.2f}'.format(timed(per_shape) / n * 1e6).rjust(20),\
+            '{0:.2f}'.format(timed(group) / n * 1e6).rjust(16),\
+            '{0:.2f}'.format(timed(scheduled) / n * 1e6).rjust(20)
+
+def bench_events():
+    """Compares per-frame event dicts, bitmasks and trigger code tables."""
+    import gc
+    import copy
+    import events
+    defaults = dict([(name, False) for name in
+                     ['blk_on', 'blk_off', 'track_on', 'track_off',
+                      'fix_on', 'fix_off', 'grp_on', 'grp_off']])
+    defaults['ord_id'] = None
+    defaults['sids'] = set()
+    def encode_dict(ev):
+        # Same codes as events.encode, from the old dict of events
+        if ev['ord_id'] != None:
+            return ev['ord_id'] + 1
+        elif ev['blk_on'] or ev['blk_off']:
+            return 127 + ev['blk_on']
+        et_state = ev['fix_on'] * 4 or ev['track_on'] * 2
+        et_state = ev['track_off'] * 1 or ev['fix_off'] * 2 or et_state
+        if ev['grp_on'] or ev['grp_off']:
+            return 90 + 10 * ev['grp_on'] + et_state
+        elif et_state > 0:
+            return 110 + et_state
+        elif len(ev['sids']) > 0:
+            return sum([(n in ev['sids']) << n for n in range(4)]) + 16
+        return 0
+    sids = (1, 2)
+    n = 10000
+    def dict_frames():
+        ev = copy.deepcopy(defaults)
+        for count in range(n):
+            if count % 3 == 0:
+                ev['sids'].update(sids)
+            if encode_dict(ev) != 0:
+                encode_dict(ev)
+            encode_dict(ev)
+            encode_dict(ev)
+            ev = copy.deepcopy(defaults)
+    def mask_frames():
+        ev = 0
+        for count in range(n):
+            if count % 3 == 0:
+                ev |= events.sid_bits(sids)
+            code = events.encode(ev)
+            ev = 0
+    codes = events.code_table()
+    def table_frames():
+        ev = 0
+        for count in range(n):
+            if count % 3 == 0:
+                ev |= events.sid_bits(sids)
+            code = (ev >> events.ORD_SHIFT) or codes[ev]
+            ev = 0
+    print 'events'.rjust(8), 'us/frame'.rjust(10),\
+        'gen-0 collections'.rjust(18)
+    threshold = gc.get_threshold()
+    for name, func in [('dict', dict_frames), ('bitmask', mask_frames),
+                       ('table', table_frames)]:
+        elapsed = timed(func)
+        # With a threshold of 1, every allocation of a container object
+        # that outlives the next one triggers a generation 0 collection
+        gc.collect()
+        gc.set_threshold(1, 2**30, 2**30)
+        before = gc.get_count()[1]
+        func()
+        collections = gc.get_count()[1] - before
+        gc.set_threshold(*threshold)
+        print name.rjust(8), '{0:.2f}'.format(elapsed / n * 1e6).rjust(10),\
+            str(collections).rjust(18)
+
+def bench_encode():
+    """Measures export throughput with different numbers of encoders."""
+    import os
+    import shutil
+    import tempfile
+    import encoder
+    try:
+        import numpy
+    except ImportError:
+        print 'skipped: NumPy not available'
+        return
+    width, height, n = 800, 600, 60
+    # Checkerboard-like frames, alternating between two phases
+    cells = numpy.add.outer(numpy.arange(height) // 40,
+                            numpy.arange(width) // 40) % 2
+    frames = [numpy.repeat((cells ^ k) * 255, 3).astype(numpy.uint8).
+              tostring() for k in range(2)]
+    print 'cores:', encoder.CPU_COUNT
+    print 'encoders'.rjust(10), 'frames/s'.rjust(10)
+    for threads in sorted(set([1, 2, 4, encoder.CPU_COUNT])):
+        tmpdir = tempfile.mkdtemp()
+        def export():
+            writer = encoder.FrameWriter(threads)
+            for count in range(n):
+                path = os.path.join(tmpdir, '{0}.png'.format(count))
+                writer.put(path, width, height, frames[count % 2])
+            writer.close()
+        try:
+            elapsed = timed(export)
+        finally:
+            shutil.rmtree(tmpdir)
+        print str(threads).rjust(10), '{0:.1f}'.format(n / elapsed).rjust(10)
+
+def bench_timer():
+    """Compares jitter and CPU use of busy-waiting and hybrid frame pacing."""
+    import os
+    import utils
+    fps, n = 100, 100
+    period = 1.0 / fps
+    def legacy(periods):
+        # Timer.tick as it was, busy-waiting on time.time
+        start = time.time()
+        last = None
+        for count in range(n):
+            while time.time() - start < period:
+                pass
+            start = time.time()
+            if last != None:
+                periods.append(start - last)
+            last = start
+    print 'clock:', utils.monotonic.__name__, 'fps:', fps
+    print 'pacing'.rjust(14), 'mean ms'.rjust(10), 'jitter ms'.rjust(10),\
+        'max ms'.rjust(10), 'cpu %'.rjust(8)
+    tests = [('legacy', None)] + [('spin ' + str(spin), spin)
+                                  for spin in [None, 0.002, 0.0005, 0]]
+    for name, spin in tests:
+        timer = utils.Timer(spin)
+        periods = []
+        cpu = sum(os.times()[:2])
+        wall = utils.monotonic()
+        if name == 'legacy':
+            legacy(periods)
+        else:
+            last = None
+            timer.tick(fps)
+            for count in range(n):
+                timer.tick(fps)
+                now = utils.monotonic()
+                if last != None:
+                    periods.append(now - last)
+                last = now
+        wall = utils.monotonic() - wall
+        cpu = sum(os.times()[:2]) - cpu
+        mean = sum(periods) / len(periods)
+        jitter = (sum([(p - mean)**2 for p in periods]) / len(periods))**0.5
+        print name.rjust(14), '{0:.3f}'.format(mean * 1e3).rjust(10),\
+            '{0:.3f}'.format(jitter * 1e3).rjust(10),\
+            '{0:.3f}'.format(max([abs(p - period) for p in periods]) *
+                             1e3).rjust(10),\
+            '{0:.0f}'.format(100 * cpu / wall).rjust(8)
+
+BENCHMARKS = [('mesh', bench_mesh),
+              ('timeline', bench_timeline),
+              ('group', bench_group),
+              ('events', bench_events),
+              ('encode', bench_encode),
+              ('timer', bench_timer)]
+
+if __name__ == '__main__':
+    names = sys.argv[1:]
+    for name, func in BENCHMARKS:
+        if len(names) > 0 and name not in names:
+            continue
+        print '==', name, '-', func.__doc__
+        func()
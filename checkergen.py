@@ -1,7 +1,11 @@
 #! /usr/bin/env python
 
 """
-usage: checkergen.py [-h] [-c] [-d] [-e DUR] [-f] [--dir PATH] [project]
+usage: checkergen.py [-h] [-c] [-d] [-e DUR] [-f] [--dir PATH]
+                     [--format {png,y4m,rgb,apng}] [--engine {gl,software}]
+                     [--dedupe {link,manifest}] [--jobs N]
+                     [--readback {pbo,sync}] [--indexed]
+                     [project]
 
 Generate flashing checkerboard patterns for display or export as a series of
 images, intended for use in psychophysics experiments. Enters interactive
@@ -18,10 +22,29 @@ optional arguments:
   -f, --fullscreen      animation displayed in fullscreen mode
   --dir PATH            destination directory for export (default: current
                         working directory)
+  --format {png,y4m,rgb,apng}
+                        export one PNG image per frame (png), or all frames
+                        into a single YUV4MPEG2 (y4m), raw RGB24 (rgb) or
+                        animated PNG (apng) file
+  --engine {gl,software}
+                        draw exported frames with OpenGL (gl) or with NumPy
+                        only, needing no display (software)
+  --dedupe {link,manifest}
+                        export repeated frames as hardlinks (link) or list
+                        them in a manifest file (manifest)
+  --jobs N              export ranges of frames in N processes at once
+                        (requires the software engine)
+  --readback {pbo,sync}
+                        read exported frames back from OpenGL through a
+                        ring of pixel buffers (pbo, default) or one at a
+                        time (sync)
+  --indexed             export palette PNG images, which are smaller and
+                        faster to write (requires the software engine)
 """
 
 import sys
 sys.path.append('src')
+
 import core
 import cli
 
@@ -30,10 +53,23 @@ msg = cli.process_args(args)
 
 if msg != None:
     print msg
+    sys.exit(1)
 
 if args.export_flag:
-    args.proj.export(export_dir=args.export_dir,
-                     export_duration=args.export_dur)
+    try:
+        stalls = args.proj.export(expo_dir=args.export_dir,
+                                  expo_dur=args.export_dur,
+                                  engine=args.engine,
+                                  dedupe=args.dedupe,
+                                  jobs=args.jobs,
+                                  readback=args.readback,
+                                  indexed=args.indexed,
+                                  expo_fmt=args.expo_fmt)
+    except (IOError, ValueError, NotImplementedError):
+        print "error:", str(sys.exc_value)
+        sys.exit(1)
+    if len(stalls) > 0:
+        print cli.stall_summary(stalls)
 if args.display_flag:
     args.proj.display(fullscreen=args.fullscreen)
 if args.cmd_mode:
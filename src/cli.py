@@ -74,6 +74,7 @@ PARSER.add_argument('-d', '--display',
                     dest='display_flag', action='store_true',
                     help='displays the stimulus on the screen')
 PARSER.add_argument('-e', '--export', dest='export_dur', metavar='DUR',
+                    type=to_decimal,
                     help='export DUR seconds of the stimulus')
 PARSER.add_argument('-f', '--fullscreen', action='store_true',
                     help='stimulus displayed in fullscreen mode')
@@ -81,9 +82,37 @@ PARSER.add_argument('--dir', dest='export_dir',
                     default=os.getcwd(), metavar='PATH',
                     help='''destination directory for export
                             (default: current working directory)''')
-PARSER.add_argument('path', metavar='project', nargs='?', type=file,
+PARSER.add_argument('--format', dest='expo_fmt', choices=core.EXPORT_FORMATS,
+                    default='png',
+                    help='''export one PNG image per frame (png), or all
+                            frames into a single YUV4MPEG2 (y4m), raw
+                            RGB24 (rgb) or animated PNG (apng) file''')
+PARSER.add_argument('--engine', choices=core.EXPORT_ENGINES, default='gl',
+                    help='''draw exported frames with OpenGL (gl) or with
+                            NumPy only, needing no display (software)''')
+PARSER.add_argument('--dedupe', choices=core.DEDUPE_MODES,
+                    help='''export repeated frames as hardlinks (link) or
+                            list them in a manifest file (manifest)''')
+PARSER.add_argument('--jobs', metavar='N', type=int,
+                    help='''export ranges of frames in N processes at once
+                            (requires the software engine)''')
+PARSER.add_argument('--readback', choices=core.READBACK_MODES,
+                    help='''read exported frames back from OpenGL through
+                            a ring of pixel buffers (pbo, default) or one
+                            at a time (sync)''')
+PARSER.add_argument('--indexed', action='store_true',
+                    help='''export palette PNG images, which are smaller
+                            and faster to write (requires the software
+                            engine)''')
+PARSER.add_argument('path', metavar='project', nargs='?',
                     help='checkergen project file to open')
 
+def stall_summary(stalls):
+    """Returns a line summarizing the time spent reading back frames."""
+    return ('readback stalls: {0:.3f} ms per frame on average, ' +
+            '{1:.3f} ms at most').format(1000 * sum(stalls) / len(stalls),
+                                         1000 * max(stalls))
+
 def process_args(args):
     """Further processes the arguments returned by the main parser."""
 
@@ -885,6 +914,11 @@ class CkgCmd(cmd.Cmd):
                                 help='''make checkerboards only draw first
                                         color for one frame to facilitate
                                         testing with a photodiode''')
+    display_parser.add_argument('-sh', '--shaders', action=store_truth(),
+                                metavar='t/f',
+                                help='''draw each checkerboard as a single
+                                        quad using a fragment shader if
+                                        supported by the graphics driver''')
     display_parser.add_argument('-lt', '--logtime', action=store_truth(),
                                 metavar='t/f',
                                 help='output frame timestamps to a log file')
@@ -934,6 +968,30 @@ class CkgCmd(cmd.Cmd):
     display_parser.add_argument('-nl', '--nolog', action=store_truth(),
                                 metavar='t/f',
                                 help='''do not write a log file''')
+    display_parser.add_argument('-ls', '--logstream', action=store_truth(),
+                                metavar='t/f',
+                                help='''write logged frames to a .part file
+                                        during the run, copied into the
+                                        log file after it''')
+    display_parser.add_argument('-pf', '--profile', action=store_truth(),
+                                metavar='t/f',
+                                help='''time each phase of every frame and
+                                        print percentiles after the run''')
+    display_parser.add_argument('-pd', '--profdump', action=store_truth(),
+                                metavar='t/f',
+                                help='''also write phase durations of every
+                                        frame to a .prof file''')
+    display_parser.add_argument('-dc', '--dropcheck', action=store_truth(),
+                                metavar='t/f',
+                                help='''measure the refresh rate before
+                                        the run, then detect dropped frames
+                                        and log them by group''')
+    display_parser.add_argument('-pc', '--pace', metavar='SECONDS',
+                                type=float,
+                                help='''hold back each flip until it is
+                                        due, for displays without vsync,
+                                        busy-waiting for this many seconds
+                                        before it is due (0 only sleeps)''')
     display_parser.add_argument('order', nargs='*', metavar='id', type=int,
                                 help='''order in which groups should be
                                         displayed (default: random order
@@ -983,36 +1041,48 @@ class CkgCmd(cmd.Cmd):
                                             freqcheck=args.freqcheck,
                                             phototest=args.phototest,
                                             photoburst=args.photoburst,
+                                            shaders=args.shaders,
                                             eyetrack=args.eyetrack,
                                             etuser=args.etuser,
                                             etvideo=args.etvideo,
                                             tryagain=args.tryagain,
                                             trybreak=args.trybreak,
-                                            nolog=args.nolog)
+                                            nolog=args.nolog,
+                                            logstream=args.logstream,
+                                            profile=args.profile,
+                                            profdump=args.profdump,
+                                            dropcheck=args.dropcheck,
+                                            pace=args.pace)
             print "display flags saved to project"
         else:
             print "displaying...",
             try:
-                self.cur_proj.display(name=args.name,
-                                      repeats=args.repeats,
-                                      waitless=args.waitless,
-                                      fullscreen=args.fullscreen,
-                                      priority=args.priority,
-                                      logtime=args.logtime,
-                                      logdur=args.logdur,
-                                      trigser=args.trigser,
-                                      trigpar=args.trigpar,
-                                      fpst=args.fpst,
-                                      freqcheck=args.freqcheck,
-                                      phototest=args.phototest,
-                                      photoburst=args.photoburst,
-                                      eyetrack=args.eyetrack,
-                                      etuser=args.etuser,
-                                      etvideo=args.etvideo,
-                                      tryagain=args.tryagain,
-                                      trybreak=args.trybreak,
-                                      nolog=args.nolog,
-                                      order=args.order)
+                drops = self.cur_proj.display(name=args.name,
+                                              repeats=args.repeats,
+                                              waitless=args.waitless,
+                                              fullscreen=args.fullscreen,
+                                              priority=args.priority,
+                                              logtime=args.logtime,
+                                              logdur=args.logdur,
+                                              trigser=args.trigser,
+                                              trigpar=args.trigpar,
+                                              fpst=args.fpst,
+                                              freqcheck=args.freqcheck,
+                                              phototest=args.phototest,
+                                              photoburst=args.photoburst,
+                                              shaders=args.shaders,
+                                              eyetrack=args.eyetrack,
+                                              etuser=args.etuser,
+                                              etvideo=args.etvideo,
+                                              tryagain=args.tryagain,
+                                              trybreak=args.trybreak,
+                                              nolog=args.nolog,
+                                              logstream=args.logstream,
+                                              profile=args.profile,
+                                              profdump=args.profdump,
+                                              dropcheck=args.dropcheck,
+                                              pace=args.pace,
+                                              order=args.order)
             except (IOError, NotImplementedError,
                     eyetracking.EyetrackingError):
                 print ''
@@ -1023,6 +1093,8 @@ class CkgCmd(cmd.Cmd):
                     pass
                 return
             print "done"
+            if drops != None:
+                print '\n'.join(drops.summary())
 
     export_parser = CmdParser(add_help=False, prog='export',
                               description='''Exports stimulus as an image
@@ -1035,6 +1107,42 @@ class CkgCmd(cmd.Cmd):
     export_parser.add_argument('-r', '--repeats', metavar='N', type=int,
                                 help='''repeatedly export specified display
                                         groups N number of times''')
+    export_parser.add_argument('-f', '--format', dest='expo_fmt',
+                               choices=core.EXPORT_FORMATS, default='png',
+                               help='''export one PNG image per frame
+                                       (png), or all frames into a single
+                                       YUV4MPEG2 (y4m), raw RGB24 (rgb) or
+                                       animated PNG (apng) file of any
+                                       length''')
+    export_parser.add_argument('--engine', choices=core.EXPORT_ENGINES,
+                               default='gl',
+                               help='''draw frames with OpenGL (gl) or
+                                       with NumPy only (software)''')
+    export_parser.add_argument('--encoders', metavar='N', type=int,
+                               help='''compress and write frames in N
+                                       threads (default: one per core)''')
+    export_parser.add_argument('--qdepth', metavar='N', type=int,
+                               help='''let at most N frames wait to be
+                                       written, limiting memory use
+                                       (default: twice the encoders)''')
+    export_parser.add_argument('--dedupe', choices=core.DEDUPE_MODES,
+                               help='''draw and write each distinct frame
+                                       once, exporting repeated frames as
+                                       hardlinks (link) or listing them in
+                                       a manifest file (manifest)''')
+    export_parser.add_argument('--jobs', metavar='N', type=int,
+                               help='''export ranges of frames in N
+                                       processes at once (requires the
+                                       software engine)''')
+    export_parser.add_argument('--readback', choices=core.READBACK_MODES,
+                               help='''read frames drawn with OpenGL back
+                                       through a ring of pixel buffers
+                                       (pbo, default) or one at a time
+                                       (sync)''')
+    export_parser.add_argument('--indexed', action='store_true',
+                               help='''save palette PNG images, which are
+                                       smaller and faster to write
+                                       (requires the software engine)''')
     export_parser.add_argument('duration', nargs='?',
                                type=to_decimal, default='Infinity',
                                help='''number of seconds of the stimulus
@@ -1072,12 +1180,20 @@ class CkgCmd(cmd.Cmd):
                     return
 
         try:
-            self.cur_proj.export(repeats=args.repeats,
-                                 order=args.order,
-                                 expo_dir=args.dir,
-                                 expo_dur=args.duration,
-                                 folder=args.folder)
-        except IOError:
+            stalls = self.cur_proj.export(repeats=args.repeats,
+                                          order=args.order,
+                                          expo_dir=args.dir,
+                                          expo_dur=args.duration,
+                                          folder=args.folder,
+                                          engine=args.engine,
+                                          encoders=args.encoders,
+                                          qdepth=args.qdepth,
+                                          dedupe=args.dedupe,
+                                          jobs=args.jobs,
+                                          readback=args.readback,
+                                          indexed=args.indexed,
+                                          expo_fmt=args.expo_fmt)
+        except (IOError, ValueError, NotImplementedError):
             print "error:", str(sys.exc_value)
             return
         except core.FrameOverflowError:
@@ -1086,12 +1202,21 @@ class CkgCmd(cmd.Cmd):
             while True:
                 try:
                     if self.__class__.yn_parse(raw_input()):
-                        self.cur_proj.export(repeats=args.repeats,
-                                             order=args.order,
-                                             expo_dir=args.dir,
-                                             expo_dur=args.duration,
-                                             folder=args.folder,
-                                             force=True)
+                        stalls = self.cur_proj.export(
+                            repeats=args.repeats,
+                            order=args.order,
+                            expo_dir=args.dir,
+                            expo_dur=args.duration,
+                            folder=args.folder,
+                            engine=args.engine,
+                            encoders=args.encoders,
+                            qdepth=args.qdepth,
+                            dedupe=args.dedupe,
+                            jobs=args.jobs,
+                            readback=args.readback,
+                            indexed=args.indexed,
+                            expo_fmt=args.expo_fmt,
+                            force=True)
                         break
                     else:
                         return
@@ -1100,6 +1225,8 @@ class CkgCmd(cmd.Cmd):
                 except EOFError:
                     return
 
+        if len(stalls) > 0:
+            print stall_summary(stalls)
         print "Export done."
 
     def do_calibrate(self, line, query=False):
@@ -25,6 +25,16 @@ from xml.dom import minidom
 import pyglet
 
 import graphics
+import geometry
+import timeline
+import events
+import raster
+import encoder
+import video
+import partition
+import profiler
+import runlog
+import quality
 import priority
 import trigger
 import eyetracking
@@ -38,10 +48,17 @@ else:
 
 CKG_FMT = 'ckg'
 LOG_FMT = 'log'
+STREAM_EXT = 'part'
+PROF_FMT = 'prof'
 MAX_EXPORT_FRAMES = 1000
+EXPORT_ENGINES = ['gl', 'software']
+EXPORT_FORMATS = ['png', 'y4m', 'rgb', 'apng']
+DEDUPE_MODES = ['link', 'manifest']
+READBACK_MODES = ['pbo', 'sync']
 EXPORT_DIR_SUFFIX = '-anim'
 XML_NAMESPACE = 'http://github.com/ZOMGxuan/checkergen'
 INT_HALF_PERIODS = True
+GRID_MESH = True
 SANS_SERIF = ('Helvetica', 'Arial', 'FreeSans')
 
 def xml_get(parent, namespace, name, index=0):
@@ -70,6 +87,16 @@ def xml_pretty_print(document, indent):
     pretty_xml = prettifier_re.sub('>\g<1></', ugly_xml)
     return pretty_xml
 
+def photoburst_phase(n, flipped):
+    """Returns the phase drawn instead of phase n with photoburst on.
+
+    The first colors are only drawn on the frame they flip to.
+
+    """
+    if n == 0 and not flipped:
+        return 1
+    return n
+
 class FileFormatError(ValueError):
     """Raised when correct file format/extension is not supplied."""
     pass
@@ -108,16 +135,30 @@ class CkgProj:
                                         ('freqcheck', False),
                                         ('phototest', False),
                                         ('photoburst', False),
+                                        ('shaders', False),
                                         ('eyetrack', False),
                                         ('etuser', False),
                                         ('etvideo', None),
                                         ('tryagain', 0),
                                         ('trybreak', None),
                                         ('nolog', False),
+                                        ('logstream', False),
+                                        ('profile', False),
+                                        ('profdump', False),
+                                        ('dropcheck', False),
+                                        ('pace', None),
                                         ('export', False),
                                         ('expo_dir', None),
                                         ('expo_dur', None),
-                                        ('folder', True)])
+                                        ('expo_fmt', 'png'),
+                                        ('folder', True),
+                                        ('engine', 'gl'),
+                                        ('encoders', None),
+                                        ('qdepth', None),
+                                        ('dedupe', None),
+                                        ('jobs', 1),
+                                        ('readback', 'pbo'),
+                                        ('indexed', False)])
 
     def __init__(self, **keywords):
         """Initializes a new project, or loads it from a path.
@@ -392,6 +433,9 @@ class CkgProj:
 
         photoburst -- make checkerboards only draw first color for one frame
 
+        shaders -- draw each checkerboard as a single quad using a fragment
+        shader, falls back to vertex batches if shaders are unavailable
+
         eyetrack -- use eyetracking to ensure subject is fixating on cross
 
         etuser -- if true, user gets to select eyetracking video source in GUI
@@ -404,9 +448,27 @@ class CkgProj:
 
         trybreak -- append a wait screen to the group queue every time
         after this many groups have been appended to the queue
+
+        logstream -- write frames to a file next to the log file while the
+        run goes on, copied into the log after the run
+
+        profile -- time the phases of each frame and print percentiles of
+        their durations after the run
+
+        profdump -- also write the duration of each phase of each frame
+        to a file named like the log file, with extension PROF_FMT
+
+        dropcheck -- measure the refresh interval before the run, then
+        detect dropped frames and log them by group
+
+        pace -- hold back each flip until it is due at the project's frame
+        rate, for displays that do not wait for the screen refresh, with
+        this many seconds of busy-waiting before it is due, 0 to only sleep
         
         order -- order in which groups (specified by id) will be displayed
 
+        Returns the quality.DropDetector of the run if dropcheck is true.
+
         """
 
         # Create RunState
@@ -425,23 +487,25 @@ class CkgProj:
             order = random.choice(self.orders)
         else:
             order = range(len(self.groups))
+        # Compile schedule before anything is shown
+        sched = timeline.Timeline(self, order, disp_ops)
         runstate = CkgRunState(name=name,
                                res=self.res, fps=self.fps, bg=self.bg,
                                cross_cols=self.cross_cols,
                                cross_times=self.cross_times,
-                               disp_ops=disp_ops, order=order)
+                               disp_ops=disp_ops, order=order,
+                               timeline=sched)
         runstate.start()
         waitscreen = CkgWaitScreen()
         # Set runstate order id if necessary
         if order in self.orders:
             runstate.ord_id = self.orders.index(order)
         # Count through pre
-        for count in range(self.pre * self.fps):
+        for show_cross in sched.pre_cross:
             if runstate.terminate:
                 break
-            pre_time = to_decimal(count) / runstate.fps
-            if pre_time in dict(self.pre_cross):
-                runstate.show_cross = dict(self.pre_cross)[pre_time]
+            if show_cross != None:
+                runstate.show_cross = show_cross
             runstate.update()
         # Loop through repeats
         repeats = runstate.disp_ops['repeats']
@@ -453,11 +517,13 @@ class CkgProj:
                 eyetracking.start()
             # Show waitscreen
             if not runstate.disp_ops['waitless']:
+                runstate.cur_gid = -1
                 waitscreen.reset()
                 waitscreen.display(runstate)
             # Loop through display groups
-            runstate.events['blk_on'] = True
+            runstate.events |= events.BLK_ON
             for n, gid in enumerate(runstate.order):
+                runstate.cur_gid = gid
                 # Set flag for freqcheck
                 if runstate.disp_ops['freqcheck']:
                     if ((i == 0 and n == 0) or
@@ -470,7 +536,7 @@ class CkgProj:
                     waitscreen.reset()
                     waitscreen.display(runstate)
                 else:
-                    self.groups[gid].display(runstate)
+                    self.groups[gid].display(runstate, sched.groups[gid])
                 if not runstate.terminate:
                     # Append group id and fail state
                     runstate.gids.append(gid)
@@ -481,7 +547,8 @@ class CkgProj:
                             if (len(runstate.add_gids) <
                                 runstate.disp_ops['tryagain']):
                                     runstate.add_gids.append(gid)
-            runstate.events['blk_off'] = True
+            runstate.events |= events.BLK_OFF
+        runstate.cur_gid = None
         # Stop freqcheck before added groups
         if runstate.disp_ops['freqcheck']:
             runstate.fc_send = False
@@ -495,32 +562,42 @@ class CkgProj:
                     eyetracking.start()
                 # Show waitscreen
                 if not runstate.disp_ops['waitless']:                
+                    runstate.cur_gid = -1
                     waitscreen.reset()
                     waitscreen.display(runstate)
-                runstate.events['blk_on'] = True
+                runstate.events |= events.BLK_ON
                 # Loop through display groups
                 for gid in blk:
                     if gid != None:
-                        self.groups[gid].display(runstate)
+                        runstate.cur_gid = gid
+                        self.groups[gid].display(runstate,
+                                                 sched.groups[gid])
                         if not runstate.terminate:
                             # Append group id and fail state
                             runstate.gids.append(gid)
                             if runstate.disp_ops['eyetrack']:
                                 runstate.fails.append(runstate.true_fail)
-                runstate.events['blk_off'] = True            
+                runstate.events |= events.BLK_OFF
+            runstate.cur_gid = None
         # Count through post
-        for count in range(self.post * self.fps):
+        for show_cross in sched.post_cross:
             if runstate.terminate:
                 break
-            post_time = to_decimal(count) / runstate.fps
-            if post_time in dict(self.post_cross):
-                runstate.show_cross = dict(self.post_cross)[post_time]
+            if show_cross != None:
+                runstate.show_cross = show_cross
             runstate.update()
 
         # Stop and output log
         runstate.stop()
         if not runstate.disp_ops['nolog']:
             runstate.log()
+        if runstate.profiler != None:
+            print ''
+            print '\n'.join(runstate.profiler.summary())
+            if runstate.disp_ops['profdump']:
+                runstate.profiler.write('{0}.{1}'.format(runstate.name,
+                                                         PROF_FMT))
+        return runstate.drops
 
     def export(self, **keywords):
         """Exports the stimulus as a series of images, one image per frame.
@@ -534,12 +611,42 @@ class CkgProj:
 
         expo_dur -- time in seconds to which export will be limited
 
+        expo_fmt -- 'png' to export one image per frame, 'y4m', 'rgb' or
+        'apng' to stream all frames into a single YUV4MPEG2, raw RGB24 or
+        animated PNG file, which may hold any number of frames
+
         folder -- if true, images will be contained in a separate folder
         within export directory
 
+        engine -- 'gl' to draw frames with OpenGL into a framebuffer
+        object, 'software' to draw them with NumPy, without OpenGL
+
+        encoders -- number of threads compressing and writing frames
+        while the next ones are drawn, one per core by default
+
+        qdepth -- maximum number of frames waiting to be written, twice
+        the number of encoders by default
+
+        dedupe -- draw and write each distinct frame only once, exporting
+        repeated frames as hardlinks to the first ('link') or only listing
+        them in a manifest file mapping frames to images ('manifest')
+
+        jobs -- number of processes exporting contiguous ranges of frames
+        in parallel, only for images drawn by the software engine
+
+        readback -- 'pbo' to read frames drawn with OpenGL back through a
+        ring of pixel buffer objects, while the next frames are drawn,
+        'sync' to read each frame directly, waiting for it to be drawn
+
+        indexed -- save images drawn by the software engine as palette
+        PNGs, with as few bits per pixel as the project's colors allow
+
         force -- force export to go through even if a large number
         of frames are to be exported
 
+        Returns the time in seconds spent waiting for the pixels of each
+        frame read back from OpenGL.
+
         """
 
         # Create RunState
@@ -554,11 +661,13 @@ class CkgProj:
             order = random.choice(self.orders)
         else:
             order = range(len(self.groups))
+        sched = timeline.Timeline(self, order, disp_ops)
         runstate = CkgRunState(name=self.name,
                                res=self.res, fps=self.fps, bg=self.bg,
                                cross_cols=self.cross_cols,
                                cross_times=self.cross_times,
-                               disp_ops=disp_ops, order=order)
+                               disp_ops=disp_ops, order=order,
+                               timeline=sched, palette=self.colors())
         runstate.start()
 
         # Warn user if a lot of frames will be exported
@@ -568,14 +677,31 @@ class CkgProj:
                           for i in order]) * disp_ops['repeats']
         total_frames = (self.pre + groups_dur + self.post) * self.fps
         frames = min(total_frames, disp_ops['expo_dur'] * self.fps)
-        if frames > MAX_EXPORT_FRAMES and not keywords['force']:
+        if (frames > MAX_EXPORT_FRAMES and not keywords['force'] and
+            disp_ops['expo_fmt'] == 'png'):
+            runstate.stop()
             msg = 'large number ({0}) of frames to be exported'.\
                 format(int(frames))
             raise FrameOverflowError(msg)
         runstate.frames = frames
 
+        if disp_ops['jobs'] > 1:
+            # Every frame can be drawn from its index alone, so split the
+            # frames exported into ranges rendered by separate processes
+            if frames < sched.frames:
+                count = int(frames.to_integral_value(ROUND_CEILING))
+            else:
+                count = sched.frames
+            try:
+                partition.run(lambda start, stop:
+                                  runstate.export_frames(self, start, stop),
+                              count, disp_ops['jobs'])
+            finally:
+                runstate.stop()
+            return runstate.stalls
+
         # Count through pre
-        for count in range(self.pre * self.fps):
+        for count in range(sched.pre):
             if runstate.terminate:
                 break
             runstate.update()
@@ -585,15 +711,99 @@ class CkgProj:
             # Loop through display groups
             for n, gid in enumerate(runstate.order):
                 if gid != -1:
-                    self.groups[gid].display(runstate)
+                    self.groups[gid].display(runstate, sched.groups[gid])
         # Count through post
-        for count in range(self.post * self.fps):
+        for count in range(sched.post):
             if runstate.terminate:
                 break
             runstate.update()
 
         # Stop runstate
         runstate.stop()
+        return runstate.stalls
+
+    def colors(self):
+        """Returns all colors the project draws, background first."""
+        colors = [self.bg]
+        for group in self.groups:
+            for shape in group.shapes:
+                colors.extend(shape.cols)
+        colors.extend(self.cross_cols)
+        distinct = []
+        for col in colors:
+            if col not in distinct:
+                distinct.append(col)
+        return distinct
+
+    def compile(self, **keywords):
+        """Returns the timeline of an export, for use with render_frame.
+
+        order -- order in which groups (specified by id) will be displayed,
+        ascending by id if not given
+
+        repeats -- number of times specified order of display groups should
+        be repeated
+
+        """
+        disp_ops = copy.deepcopy(self.__class__.DEFAULTS['disp_ops'])
+        for kw in keywords.keys():
+            if kw in disp_ops.keys() and keywords[kw] != None:
+                disp_ops[kw] = keywords[kw]
+        if 'order' in keywords.keys() and len(keywords['order']) > 0:
+            order = keywords['order']
+        else:
+            order = range(len(self.groups))
+        return timeline.Timeline(self, order, disp_ops)
+
+    def frame_state(self, n, sched):
+        """Returns what is drawn on frame n of an export, in O(1).
+
+        sched -- timeline of the export, as returned by compile
+
+        Returns a tuple (gid, bits, cross). bits holds the phase of each
+        shape in group gid, or is None if no shapes are drawn, and cross
+        is the index of the cross color shown, or None if it is hidden.
+
+        """
+        gid, count, show_cross = sched.locate(n)
+        bits = None
+        if count != None:
+            phases = sched.groups[gid].phases
+            bits = tuple([phase.bit(count) for phase in phases])
+            if sched.photoburst:
+                bits = tuple([photoburst_phase(bit, phase.flipped(count))
+                              for bit, phase in zip(bits, phases)])
+        cross = None
+        if show_cross:
+            cross = sched.cross_color(n)
+        return gid, bits, cross
+
+    def render_frame(self, n, sched, canvas=None):
+        """Draws frame n of an export without playing the frames before it.
+
+        Frames are drawn in software, as with the 'software' export engine.
+
+        sched -- timeline of the export, as returned by compile
+
+        canvas -- raster.Canvas to draw into, cleared first, a new one is
+        created if not given
+
+        Returns the canvas, see raster.Canvas.tostring and save.
+
+        """
+        gid, bits, cross = self.frame_state(n, sched)
+        if canvas == None:
+            canvas = raster.Canvas(self.res, self.bg)
+        else:
+            canvas.clear()
+        if bits != None:
+            for shape, bit in zip(self.groups[gid].shapes, bits):
+                canvas.draw_board(shape, bit)
+        if cross != None:
+            canvas.draw_cross(graphics.Cross([r/2 for r in self.res],
+                                             (20, 20),
+                                             col=self.cross_cols[cross]))
+        return canvas
  
 class CkgRunState:
     """Contains information about the state of a checkergen project
@@ -607,26 +817,16 @@ class CkgRunState:
                      ('cross_times', None),
                      ('order', []),
                      ('disp_ops', None),
+                     ('timeline', None),
+                     ('palette', None),
                      ('events', None),
                      ('gids', []),
                      ('fails', []),
                      ('add_gids', []),
-                     ('timestamps', []),
-                     ('durstamps', []),
-                     ('trigstamps', []),
-                     ('eye_x', []),
-                     ('eye_y', [])])
-
-    DEFAULTS['events'] = dict([('ord_id', None),
-                               ('blk_on', False),
-                               ('blk_off', False),
-                               ('track_on', False),
-                               ('track_off', False),
-                               ('fix_on', False),
-                               ('fix_off', False),
-                               ('grp_on', False),
-                               ('grp_off', False),
-                               ('sids', set())])
+                     ('stalls', []),
+                     ('cur_gid', None)])
+
+    DEFAULTS['events'] = 0
     
     def __init__(self, **keywords):
         """Creates the RunState."""
@@ -648,8 +848,13 @@ class CkgRunState:
             msg = "RunState intialized with insufficent project information"
             raise ValueError(msg)
 
+        if self.timeline == None:
+            msg = "RunState lacks compiled timeline"
+            raise ValueError(msg)
+
         self._count = 0
-        self._old_code = 0
+        self._code = 0
+        self._codes = events.code_table()
         self.ord_id = None
         self.terminate = False
 
@@ -669,17 +874,102 @@ class CkgRunState:
                                            anchor='topleft')
 
         # Initialize export
+        self.raster = None
         if self.disp_ops['export']:
+            if self.disp_ops['engine'] not in EXPORT_ENGINES:
+                msg = "unknown export engine '{0}'".\
+                    format(self.disp_ops['engine'])
+                raise ValueError(msg)
+            if self.disp_ops['expo_fmt'] not in EXPORT_FORMATS:
+                msg = "unknown export format '{0}'".\
+                    format(self.disp_ops['expo_fmt'])
+                raise ValueError(msg)
+            if self.disp_ops['dedupe'] not in [None] + DEDUPE_MODES:
+                msg = "unknown deduplication mode '{0}'".\
+                    format(self.disp_ops['dedupe'])
+                raise ValueError(msg)
+            if self.disp_ops['dedupe'] != None:
+                if self.disp_ops['expo_fmt'] != 'png':
+                    msg = 'only exported images can be deduplicated'
+                    raise ValueError(msg)
+                if self.disp_ops['dedupe'] == 'link' and \
+                        not hasattr(os, 'link'):
+                    msg = 'hardlinks not supported on this platform'
+                    raise NotImplementedError(msg)
+            if self.disp_ops['readback'] not in READBACK_MODES:
+                msg = "unknown readback mode '{0}'".\
+                    format(self.disp_ops['readback'])
+                raise ValueError(msg)
+            if self.disp_ops['jobs'] < 1:
+                msg = 'number of export jobs must be positive'
+                raise ValueError(msg)
+            if self.disp_ops['profile']:
+                # Exported frames skip the flip that phases are timed around
+                msg = 'frames can only be profiled while displayed'
+                raise ValueError(msg)
+            if self.disp_ops['jobs'] > 1:
+                if self.disp_ops['engine'] != 'software' or \
+                        self.disp_ops['expo_fmt'] != 'png' or \
+                        self.disp_ops['dedupe'] != None:
+                    msg = ('parallel export requires the software engine ' +
+                           'and undeduplicated png images')
+                    raise ValueError(msg)
+                if not partition.available:
+                    msg = 'parallel export requires a platform with fork()'
+                    raise NotImplementedError(msg)
+            if self.disp_ops['indexed']:
+                if self.disp_ops['engine'] != 'software' or \
+                        self.disp_ops['expo_fmt'] != 'png':
+                    msg = ('palette images can only be exported as png ' +
+                           'by the software engine')
+                    raise ValueError(msg)
+                if self.palette == None:
+                    msg = 'RunState lacks palette for palette images'
+                    raise ValueError(msg)
             if not os.path.isdir(self.disp_ops['expo_dir']):
                 msg = 'export path is not a directory'
                 raise IOError(msg)
-            if self.disp_ops['folder']:
-                self.save_dir = os.path.join(self.disp_ops['expo_dir'],
-                                             self.name + EXPORT_DIR_SUFFIX)
-            else:
+            if self.disp_ops['engine'] == 'software':
+                # Draw exported scene into an array instead of with OpenGL
+                palette = None
+                if self.disp_ops['indexed']:
+                    palette = self.palette
+                self.raster = raster.Canvas(self.res, self.bg, palette)
+            self.video = None
+            if self.disp_ops['expo_fmt'] != 'png':
+                # Stream all frames into one file, in order
                 self.save_dir = self.disp_ops['expo_dir']
-            if not os.path.isdir(self.save_dir):
-                os.mkdir(self.save_dir)
+                path = os.path.join(self.save_dir, '{0}.{1}'.\
+                                        format(self.name,
+                                               self.disp_ops['expo_fmt']))
+                self.video = video.FORMATS[self.disp_ops['expo_fmt']](
+                    path, self.res, self.fps)
+                self.writer = encoder.FrameWriter(1, self.disp_ops['qdepth'],
+                                                  self.video.write_frame)
+            else:
+                if self.disp_ops['folder']:
+                    self.save_dir = os.path.join(self.disp_ops['expo_dir'],
+                                                 self.name + EXPORT_DIR_SUFFIX)
+                else:
+                    self.save_dir = self.disp_ops['expo_dir']
+                if not os.path.isdir(self.save_dir):
+                    os.mkdir(self.save_dir)
+                if self.disp_ops['jobs'] > 1:
+                    # Worker processes write their own images
+                    self.writer = None
+                elif self.raster != None:
+                    self.writer = encoder.FrameWriter(
+                        self.disp_ops['encoders'], self.disp_ops['qdepth'],
+                        self.raster.write)
+                else:
+                    self.writer = encoder.FrameWriter(
+                        self.disp_ops['encoders'], self.disp_ops['qdepth'])
+            self.stall_timer = Timer()
+            # Path of the first image of each distinct frame, and path of
+            # the image each exported frame is found in
+            self.frame_files = {}
+            self.frame_paths = []
+        self.scene = None
 
         # Initialize ports
         if self.disp_ops['trigser']:
@@ -709,6 +999,10 @@ class CkgRunState:
                                       self.disp_ops['etvideo'])
             eyetracking.start()
 
+        # Only drawing with OpenGL needs a display
+        if self.raster == None:
+            graphics.shared_context()
+
         # Create window if not exporting
         self.scaling = False
         if not self.disp_ops['export']:
@@ -733,12 +1027,30 @@ class CkgRunState:
             self.window.set_visible()
 
         # Create framebuffer object for drawing unscaled or exported scene
-        if self.scaling or self.disp_ops['export']:
+        if self.raster == None and (self.scaling or self.disp_ops['export']):
             self.canvas = pyglet.image.Texture.create(*self.res)
             self.fbo = graphics.Framebuffer(self.canvas)
             self.fbo.start_render()
             graphics.set_clear_color(self.bg)
             self.fbo.clear()
+            if self.disp_ops['export'] and self.disp_ops['readback'] == 'pbo':
+                if graphics.have_pixel_buffers():
+                    # Frames waiting for their pixels to be mapped
+                    self.fbo.start_readback()
+                    self._pending = []
+                else:
+                    print "warning: pixel buffers not available, " + \
+                        "reading frames synchronously instead"
+                    self.disp_ops['readback'] = 'sync'
+
+        # Fall back to vertex batches if shaders cannot be used
+        if self.disp_ops['shaders']:
+            try:
+                graphics.get_checker_program()
+            except graphics.ShaderError:
+                print "warning:", str(sys.exc_value)
+                print "using batches instead..."
+                self.disp_ops['shaders'] = False
 
         # Set process priority
         if self.disp_ops['priority'] != None:
@@ -749,6 +1061,26 @@ class CkgRunState:
             except:
                 pass
 
+        # Time flips in case the display does not wait for the refresh
+        self.pacer = None
+        if self.disp_ops['pace'] != None and not self.disp_ops['export']:
+            if self.disp_ops['pace'] < 0:
+                msg = 'pacing spin time cannot be negative'
+                raise ValueError(msg)
+            self.pacer = Timer(self.disp_ops['pace'])
+
+        # Measure refresh interval by flipping the blank window
+        self.drops = None
+        if self.disp_ops['dropcheck'] and not self.disp_ops['export']:
+            self.drops = quality.DropDetector()
+            for n in range(quality.WARMUP_FRAMES + 1):
+                self.window.dispatch_events()
+                self.window.clear()
+                self.window.flip()
+                pyglet.gl.glFinish()
+                self.drops.warmup()
+            self.drops.start()
+
         # Start timers
         if self.disp_ops['logtime']:
             self.timer = Timer()
@@ -757,8 +1089,29 @@ class CkgRunState:
             self.dur = Timer()
             self.dur.start()
 
+        # Allocate the log for the whole run, or start streaming it
+        self.runlog = None
+        if self.disp_ops['logtime'] or self.disp_ops['logdur']:
+            if self.disp_ops['logstream'] and not self.disp_ops['nolog']:
+                path = '{0}.{1}'.format(self.log_path(), STREAM_EXT)
+                self.runlog = runlog.LogStream(path, self.log_header())
+            else:
+                self.runlog = runlog.RunLog(self.timeline.frames)
+
+        # Start timing phases of each frame
+        self.profiler = None
+        if self.disp_ops['profile']:
+            self.profiler = profiler.PhaseProfiler()
+
+        # Leave the setup above out of the duration of the first frame
+        if self.drops != None:
+            self.drops.begin()
+
     def update(self):
         """Update the RunState."""
+        prof = self.profiler
+        if prof != None:
+            prof.mark(profiler.DRAW)
 
         # Check for tracking and fixation
         if self.disp_ops['eyetrack']:
@@ -782,17 +1135,17 @@ class CkgRunState:
             # Update eyetracking events
             if self.tracked != self.old_tracked:
                 if self.tracked:
-                    self.events['track_on'] = True
+                    self.events |= events.TRACK_ON
                 else:
-                    self.events['track_off'] = True
+                    self.events |= events.TRACK_OFF
             if self.fixated != self.old_fixated:
                 if self.fixated:
-                    self.events['fix_on'] = True
+                    self.events |= events.FIX_ON
                 else:
-                    self.events['fix_off'] = True
-            if self.events['grp_on']:
+                    self.events |= events.FIX_OFF
+            if self.events & events.GRP_ON:
                 if self.tracked and not self.fixated:
-                    self.events['fix_off'] = True
+                    self.events |= events.FIX_OFF
 
             # Check for failure of trial
             if self.tracked and not self.fixated:
@@ -801,19 +1154,35 @@ class CkgRunState:
         else:
             # Change cross color based on time
             if self.show_cross:
-                if (self._count % (sum(self.cross_times) * self.fps) 
-                    < self.cross_times[0] * self.fps):
-                    self.fix_crosses[0].draw()
+                cross = self.fix_crosses[self.timeline.cross_color(self._count)]
+                if self.raster != None:
+                    self.raster.draw_cross(cross)
                 else:
-                    self.fix_crosses[1].draw()                
-                
-        if self.disp_ops['export']:
-            # Save current frame to file
-            savepath = os.path.join(
-                self.save_dir, '{0}{2}.{1}'.\
-                    format(self.name, 'png',
-                           repr(self._count).zfill(numdigits(self.frames-1))))
-            self.canvas.save(savepath)
+                    cross.draw()
+
+        if prof != None:
+            prof.mark(profiler.POLL)
+
+        # Look up trigger code of events once, before the flip
+        self._code = ((self.events >> events.ORD_SHIFT) or
+                      self._codes[self.events])
+
+        if self.disp_ops['export'] and self.video != None:
+            # Hand current frame over to be appended to the video
+            self.export_frame()
+        elif self.disp_ops['export']:
+            # Hand current frame over to be saved to file
+            savepath = self.frame_path(self._count)
+            key = None
+            if self.disp_ops['dedupe'] != None:
+                key = self.frame_key()
+            if key in self.frame_files:
+                self.frame_paths.append(self.frame_files[key])
+            else:
+                if key != None:
+                    self.frame_files[key] = savepath
+                self.frame_paths.append(savepath)
+                self.export_frame(savepath, self.res[0], self.res[1])
         else:
             # Blit canvas to screen if necessary
             if self.scaling:
@@ -821,43 +1190,56 @@ class CkgRunState:
                 self.canvas.blit(0, 0)
             self.window.switch_to()
             self.window.dispatch_events()
+            if prof != None:
+                prof.mark(profiler.DISPATCH)
+            if self.pacer != None:
+                self.pacer.tick(self.fps)
             self.window.flip()
+            if prof != None:
+                prof.mark(profiler.FLIP)
             # Make sure everything has been drawn
             pyglet.gl.glFinish()
-
-        # Append time information to lists
+            if prof != None:
+                prof.mark(profiler.FINISH)
+            if self.drops != None:
+                phases = None
+                if self.scene != None:
+                    phases = self.scene[1]
+                self.drops.frame(self.cur_gid, phases)
+
+        # Take timestamp right after the flip
+        timestamp = latency = runlog.MISSING
         if self.disp_ops['logtime']:
-            self.timestamps.append(self.timer.elapsed())
-        elif self.disp_ops['logdur']:
-            self.timestamps.append('')
-        if self.disp_ops['logdur']:
-            self.durstamps.append(self.dur.restart())
-        elif self.disp_ops['logtime']:
-            self.durstamps.append('')
+            timestamp = self.timer.elapsed()
 
-        # Send trigger ASAP after flip
+        # Send trigger ASAP after flip, timing how long that took. As
+        # always, the code goes out on every frame, even if unchanged
         if self.disp_ops['trigser'] or self.disp_ops['trigpar']:
-            if self.encode_events() != self._old_code:
-                trigger.send(self.disp_ops['trigser'],
-                             self.disp_ops['trigpar'],
-                             self.encode_events())
-            self._old_code = self.encode_events
-
-        # Log eye positions and when triggers are sent
-        if self.disp_ops['logtime']:
+            trigger.send(self.disp_ops['trigser'],
+                         self.disp_ops['trigpar'],
+                         self._code)
+            if self.disp_ops['logtime']:
+                latency = self.timer.elapsed() - timestamp
+        if prof != None:
+            prof.mark(profiler.TRIGGER)
+
+        # Log time information, eye positions and triggers sent
+        if self.runlog != None:
+            duration = eye_x = eye_y = runlog.MISSING
+            if self.disp_ops['logdur']:
+                duration = self.dur.restart()
             if self.disp_ops['eyetrack']:
-                self.eye_x.append(eyetracking.x_pos())
-                self.eye_y.append(eyetracking.y_pos())
-            else:
-                self.eye_x.append('')
-                self.eye_y.append('')
-            if self.encode_events() > 0:
-                self.trigstamps.append(self.encode_events())
-            else:
-                self.trigstamps.append('')
+                eye_x = eyetracking.x_pos()
+                eye_y = eyetracking.y_pos()
+            self.runlog.append(timestamp, duration, self._code, latency,
+                               eye_x, eye_y)
+        if prof != None:
+            prof.mark(profiler.LOG)
 
         # Clear canvas, events, prepare for next frame
-        if self.disp_ops['export']:
+        if self.raster != None:
+            self.raster.clear()
+        elif self.disp_ops['export']:
             self.fbo.clear()
         else:
             if self.scaling:
@@ -867,11 +1249,15 @@ class CkgRunState:
                 self.window.clear()
             if self.window.has_exit:
                 self.terminate = True
+        if prof != None:
+            prof.mark(profiler.CLEAR)
+            prof.next_frame()
+        self.scene = None
         # Send ord_id immediately after blk_on
-        send_ord_id_next = self.events['blk_on']
-        self.events = copy.deepcopy(self.__class__.DEFAULTS['events'])
-        if send_ord_id_next:
-            self.events['ord_id'] = self.ord_id
+        if self.events & events.BLK_ON:
+            self.events = events.ord_bits(self.ord_id)
+        else:
+            self.events = 0
 
         self._count += 1
         
@@ -884,7 +1270,21 @@ class CkgRunState:
         """Clean up RunState."""
         if self.disp_ops['eyetrack']:
             eyetracking.stop()
-        if self.scaling or self.disp_ops['export']:
+        if self.streaming():
+            self.runlog.close()
+        if self.disp_ops['export']:
+            if self.raster == None and self.disp_ops['readback'] == 'pbo':
+                self.stall_timer.start()
+                for data in self.fbo.flush_pixels():
+                    self.writer.put(*(self._pending.pop(0) + (data,)))
+                self.stalls.append(self.stall_timer.stop())
+            if self.writer != None:
+                self.writer.close()
+            if self.video != None:
+                self.video.close()
+            if self.disp_ops['dedupe'] != None:
+                self.write_duplicates()
+        if self.scaling or (self.disp_ops['export'] and self.raster == None):
             self.fbo.delete()
             del self.canvas
         if not self.disp_ops['export']:
@@ -896,42 +1296,92 @@ class CkgRunState:
         except:
             pass
 
-    def encode_events(self):
-        """Hard code specific trigger values for events."""
-        code = 0
-        if self.events['ord_id'] != None:
-            code = self.events['ord_id'] + 1
-        elif self.events['blk_on']:
-            code = 128
-        elif self.events['blk_off']:
-            code = 127
+    def frame_path(self, count):
+        """Returns path of the image file frame count is exported to."""
+        digits = numdigits(self.frames - 1)
+        return os.path.join(self.save_dir, '{0}{2}.{1}'.\
+                                format(self.name, 'png',
+                                       repr(count).zfill(digits)))
+
+    def export_frame(self, *job):
+        """Hands the current frame over to the writer once it is read.
+
+        job -- arguments of writer.put that precede the frame's pixels
+
+        """
+        if self.raster != None:
+            self.writer.put(*(job + (self.raster.tostring(),)))
+            return
+        self.stall_timer.start()
+        if self.disp_ops['readback'] == 'pbo':
+            # Pixels of an earlier frame come back once the ring is full
+            self._pending.append(job)
+            data = self.fbo.read_pixels()
+            if data != None:
+                job = self._pending.pop(0)
         else:
-            et_state = 0
-            if self.events['fix_on']:
-                et_state = 4
-            elif self.events['track_on']:
-                et_state = 2
-            if self.events['track_off']:
-                et_state = 1
-            elif self.events['fix_off']:
-                et_state = 2
-            if self.events['grp_on']:
-                code = 100 + et_state
-            elif self.events['grp_off']:
-                code = 90 + et_state
-            elif et_state > 0:
-                code = 110 + et_state
-            elif len(self.events['sids']) > 0:
-                code = ((0 in self.events['sids'])*2**0 +
-                        (1 in self.events['sids'])*2**1 +
-                        (2 in self.events['sids'])*2**2 +
-                        (3 in self.events['sids'])*2**3 +
-                        16)
-        return code
+            data = graphics.get_texture_data(self.canvas)
+        self.stalls.append(self.stall_timer.stop())
+        if data != None:
+            self.writer.put(*(job + (data,)))
 
-    def log(self, path=None):
-        """Write a log file for the experimental run in the CSV format."""
+    def export_frames(self, proj, start, stop):
+        """Draws and saves frames start to stop - 1 of proj in software.
+
+        Used by worker processes of parallel exports, see partition.run.
+
+        """
+        for count in range(start, stop):
+            proj.render_frame(count, self.timeline, self.raster)
+            self.raster.save(self.frame_path(count))
+
+    def frame_key(self):
+        """Returns fingerprint of everything drawn on the current frame."""
+        cross = None
+        if self.show_cross:
+            cross = self.timeline.cross_color(self._count)
+        return (self.scene, cross)
+
+    def exported_before(self, scene):
+        """Returns true if an identical frame has already been exported.
+
+        scene -- fingerprint of the shapes drawn on the current frame,
+        remembered until the next frame
+
+        """
+        if not self.disp_ops['export'] or self.disp_ops['dedupe'] == None:
+            return False
+        self.scene = scene
+        return self.frame_key() in self.frame_files
+
+    def write_duplicates(self):
+        """Exports repeated frames as hardlinks or lists them in a manifest."""
+        if self.disp_ops['dedupe'] == 'link':
+            for n, image in enumerate(self.frame_paths):
+                path = self.frame_path(n)
+                if path != image:
+                    if os.path.exists(path):
+                        os.remove(path)
+                    os.link(image, path)
+        else:
+            manifest = os.path.join(self.save_dir,
+                                    '{0}-frames.txt'.format(self.name))
+            with open(manifest, 'wb') as mfile:
+                writer = csv.writer(mfile, dialect='excel-tab')
+                writer.writerow(['frame', 'image'])
+                for n, image in enumerate(self.frame_paths):
+                    writer.writerow([n, os.path.basename(image)])
 
+    def encode_events(self):
+        """Returns trigger value for the events of the current frame."""
+        return events.encode(self.events)
+
+    def streaming(self):
+        """Returns true if the log is written while the run goes on."""
+        return isinstance(self.runlog, runlog.LogStream)
+
+    def log_path(self, path=None):
+        """Returns path of the log file, named after the run by default."""
         if path == None:
             path = os.path.join(os.getcwd(),
                                 '{0}.{1}'.format(self.name, LOG_FMT))
@@ -939,14 +1389,29 @@ class CkgRunState:
             self.name, ext = os.path.splitext(os.path.basename(path))
             if ext != '.{0}'.format(LOG_FMT):
                 path = '{0}.{1}'.format(path, LOG_FMT)
+        return path
+
+    def log_header(self):
+        """Returns rows of the log file known before the run starts."""
+        return [['checkergen log file'],
+                ['display options:'],
+                self.disp_ops.keys(),
+                self.disp_ops.values(),
+                ['order:'] + self.order]
+
+    def log(self, path=None):
+        """Write a log file for the experimental run in the CSV format.
+
+        If the log was streamed during the run, the frames streamed are
+        copied into the log file, which is laid out as it is otherwise,
+        and the file they were streamed to is removed.
+
+        """
 
+        path = self.log_path(path)
         with open(path, 'wb') as logfile:
             writer = csv.writer(logfile, dialect='excel-tab')
-            writer.writerow(['checkergen log file'])
-            writer.writerow(['display options:'])
-            writer.writerow(self.disp_ops.keys())
-            writer.writerow(self.disp_ops.values())
-            writer.writerow(['order:'] + self.order)
+            writer.writerows(self.log_header())
             writer.writerow(['groups', 'failure'])
             if not self.disp_ops['eyetrack']:
                 self.fails = ['NA'] * len(self.gids)
@@ -957,13 +1422,30 @@ class CkgRunState:
                 for blk in grouper(self.add_gids,
                                    self.disp_ops['trybreak'], ''):
                     writer.writerow(blk)
-            if self.disp_ops['logtime'] or self.disp_ops['logdur']:
-                stamps = [self.timestamps, self.durstamps, self.trigstamps,
-                          self.eye_x, self.eye_y]
-                writer.writerow(['timestamps', 'durations', 'triggers',
-                                 'eye x (mm)', 'eye y (mm)'])
-                for stamp in zip(*stamps):
-                    writer.writerow(list(stamp))
+            if self.drops != None:
+                writer.writerow(['refresh interval', self.drops.interval])
+                writer.writerow(['groups', 'dropped frames'])
+                for gid, dropped in sorted(self.drops.by_group().items()):
+                    if gid == None:
+                        gid = 'NA'
+                    writer.writerow([gid, dropped])
+                writer.writerow(['late frames', 'group', 'shape phases',
+                                 'duration'])
+                for count, gid, phases, duration in self.drops.drops:
+                    if gid == None:
+                        gid = 'NA'
+                    if phases == None:
+                        phases = 'NA'
+                    else:
+                        phases = ''.join([str(bit) for bit in phases])
+                    writer.writerow([count, gid, phases, duration])
+            if self.streaming():
+                self.runlog.copy(logfile)
+            elif self.runlog != None:
+                writer.writerow(runlog.COLUMNS)
+                writer.writerows(self.runlog.rows())
+        if self.streaming():
+            os.remove(self.runlog.path)
 
 class CkgDisplayGroup:
 
@@ -1014,63 +1496,84 @@ class CkgDisplayGroup:
         """Returns total duration of display group."""
         return self.pre + self.disp + self.post
 
-    def reset(self):
-        """Resets counts and all contained shapes."""
-        self._flip_count = [0] * len(self.shapes)
-        for shape in self.shapes:
-            shape.reset()
+    def reset(self, compute=False):
+        """Resets all contained shapes.
 
-    def draw(self, runstate):
-        """Draws all contained shapes during the appropriate interval."""
-        for shape in self.shapes:
-            shape.draw(photoburst=runstate.disp_ops['photoburst'])
+        compute -- compute models of the shapes for drawing with OpenGL
+        now instead of on their first draw, unless already done
 
-    def update(self, runstate):
-        """Updates contained shapes, sets event triggers."""
-        # Set events to be sent
-        if runstate.disp_ops['fpst'] > 0:
-            for n, shape in enumerate(self.shapes):
-                if shape.flipped:
-                    self._flip_count[n] += 1
-                if self._flip_count[n] >= runstate.disp_ops['fpst']:
-                    if not runstate.disp_ops['freqcheck'] or runstate.fc_send:
-                        runstate.events['sids'].add(n)
-                    self._flip_count[n] = 0
-        # Update contained shapes
+        """
         for shape in self.shapes:
-            shape.update(runstate.fps)
+            shape.reset(compute=compute)
+
+    def compile(self, fps, fpst=0):
+        """Returns the frame schedule of the group."""
+        return timeline.GroupSchedule(self, fps, fpst)
+
+    def draw(self, runstate, sched, count):
+        """Draws all contained shapes as scheduled for frame count."""
+        state = sched.state
+        state.advance(count)
+        bits = tuple(state.bits)
+        if runstate.disp_ops['photoburst']:
+            bits = tuple([photoburst_phase(bit, flipped)
+                          for bit, flipped in zip(bits, state.flipped)])
+        if runstate.drops != None:
+            # Remember what is shown in case the frame is dropped
+            runstate.scene = (self, bits)
+        if runstate.exported_before((self, bits)):
+            return
+        if runstate.raster != None:
+            for shape, bit in zip(self.shapes, bits):
+                runstate.raster.draw_board(shape, bit)
+            return
+        for shape, bit in zip(self.shapes, bits):
+            shape.draw_phase(bit, shaders=runstate.disp_ops['shaders'])
 
-    def display(self, runstate):
-        """Display the group in the context described by supplied runstate."""
-        self.reset()
-        for count in range(self.pre * runstate.fps):
+    def update(self, runstate, sched, count):
+        """Sets event triggers scheduled for frame count."""
+        sched.state.advance(count)
+        sids = sched.state.sids
+        if len(sids) > 0:
+            if not runstate.disp_ops['freqcheck'] or runstate.fc_send:
+                runstate.events |= events.sid_bits(sids)
+
+    def display(self, runstate, sched=None):
+        """Display the group in the context described by supplied runstate.
+
+        sched -- schedule of the group compiled for the run, compiled
+        before display if not supplied
+
+        """
+        if sched == None:
+            sched = self.compile(runstate.fps, runstate.disp_ops['fpst'])
+        self.reset(compute=(runstate.raster == None))
+        for show_cross in sched.pre_cross:
             if runstate.terminate:
                 break
-            pre_time = to_decimal(count) / runstate.fps
-            if pre_time in dict(self.pre_cross):
-                runstate.show_cross = dict(self.pre_cross)[pre_time]
+            if show_cross != None:
+                runstate.show_cross = show_cross
             runstate.update()
-        runstate.events['grp_on'] = True
+        runstate.events |= events.GRP_ON
         runstate.show_cross = True
         if runstate.disp_ops['eyetrack']:
             runstate.fix_fail = False
             runstate.true_fail = False
-        for count in range(self.disp * runstate.fps):
+        for count in range(sched.disp):
             if runstate.terminate:
                 break
-            self.draw(runstate)
-            self.update(runstate)
+            self.draw(runstate, sched, count)
+            self.update(runstate, sched, count)
             runstate.update()
-        runstate.events['grp_off'] = True
+        runstate.events |= events.GRP_OFF
         if runstate.disp_ops['eyetrack']:
             if runstate.fix_fail:
                 runstate.true_fail = True
-        for count in range(self.post * runstate.fps):
+        for show_cross in sched.post_cross:
             if runstate.terminate:
                 break
-            post_time = to_decimal(count) / runstate.fps
-            if post_time in dict(self.post_cross):
-                runstate.show_cross = dict(self.post_cross)[post_time]
+            if show_cross != None:
+                runstate.show_cross = show_cross
             runstate.update()
 
     def save(self, document, parent):
@@ -1225,10 +1728,12 @@ class CheckerBoard(CheckerShape):
             value = to_decimal(value)
         # Store value
         self.__dict__[name] = value
-        # Recompute if necessary
+        # Recompute if necessary, recoloring does not touch geometry
         if name in ['dims', 'init_unit', 'end_unit', 
-                    'position', 'anchor','cols']:
+                    'position', 'anchor']:
             self._computed = False
+        elif name == 'cols':
+            self._colored = False
 
     def save(self, document, parent):
         """Saves board in specified XML document as child of parent."""
@@ -1249,45 +1754,90 @@ class CheckerBoard(CheckerShape):
                 print "using default value '{0}' instead...".format(value)
             setattr(self, var, value)
 
-    def reset(self, new_phase=None):
-        """Resets checkerboard animation back to initial phase."""
+    def reset(self, new_phase=None, compute=False):
+        """Resets checkerboard animation back to initial phase.
+
+        compute -- compute model for drawing with OpenGL now if necessary,
+        otherwise it is computed on the first draw
+
+        """
         if new_phase == None:
             new_phase = self.phase
-        self._cur_phase = new_phase
-        self._prev_phase = new_phase
+        self._reset_phase = new_phase
+        self._engine = timeline.make_phase(new_phase, fps=None)
+        self._count = 0
         self.flipped = False
         self._first_draw = True
-        if not self._computed:
+        if compute and not self._computed:
             self.compute()
 
+    def phase_engine(self, fps, phase=None, frames=0):
+        """Returns the phase of the checkerboard on any frame.
+
+        phase -- initial phase in degrees, defaults to self.phase
+
+        frames -- number of frames to work out flips for in advance,
+        see timeline.make_phase
+
+        """
+        if phase == None:
+            phase = self.phase
+        return timeline.make_phase(phase, self.freq, fps, INT_HALF_PERIODS,
+                                   frames)
+
     def update(self, fps):
-        """Increase the current phase of the checkerboard animation."""
-        self._prev_phase = self._cur_phase
-        if self.freq != 0:
-            if INT_HALF_PERIODS:
-                frames_per_half_period = round(fps / (self.freq * 2))
-                degs_per_frame = 180 / to_decimal(frames_per_half_period)
-            else:
-                degs_per_frame = 360 * self.freq / fps
-            self._cur_phase += degs_per_frame
-            if self._cur_phase >= 360:
-                self._cur_phase %= 360
-        cur_n = int(self._cur_phase // 180)
-        prev_n = int(self._prev_phase // 180)
-        if cur_n != prev_n:
-            self.flipped = True
-        else:
-            self.flipped = False
+        """Advance the checkerboard animation by one frame."""
+        if self._engine.fps != fps:
+            self._engine = self.phase_engine(fps, self._reset_phase)
+        self._count += 1
+        self.flipped = self._engine.flipped(self._count)
 
     def compute(self):
         """Computes a model of the checkerboard for drawing later."""
-        # Create batches to store model
-        self._batches = [pyglet.graphics.Batch() for n in range(2)]
+        # Create batch to store model
+        self._batch = pyglet.graphics.Batch()
 
         # Calculate size of checkerboard in pixels
         self._size = tuple([(y1 + y2) / 2 * n for y1, y2, n in
                             zip(self.init_unit, self.end_unit, self.dims)])
 
+        # Share corner vertices between cells where they abut exactly
+        self._grid = None
+        group = None
+        if geometry.available:
+            # Compute all cells at once
+            loc = graphics.locations[self.anchor]
+            if GRID_MESH:
+                self._grid = geometry.grid_bounds(self.dims, self.init_unit,
+                                                  self.end_unit,
+                                                  self.position, loc)
+            if self._grid != None:
+                verts = geometry.grid_verts(self._grid)
+                indices = geometry.grid_indices(self.dims)
+                group = graphics.FlatShadingGroup()
+            else:
+                verts = geometry.board_verts(self.dims, self.init_unit,
+                                             self.end_unit, self.position, loc)
+                indices = geometry.board_indices(self.dims)
+        else:
+            verts, indices = self._compute_rects()
+
+        # Single quad to be drawn by a shader instead
+        self._quad = self._compute_quad()
+
+        # Store geometry once, colors are swapped in on a flip
+        self._computed = True
+        self.recolor()
+        self._vertex_list = graphics.add_mesh_to_batch(self._batch, verts,
+                                                       indices,
+                                                       self._col_arrays[0],
+                                                       group)
+        self._drawn_n = 0
+
+    def _compute_rects(self):
+        """Returns vertices and indices of all unit cells, without NumPy."""
+        verts, indices = [], []
+
         # Calculate unit size gradient
         unit_grad = tuple([(2 if (flag == 0) else 1) * 
                            (y2 - y1) / n for y1, y2, n, flag in 
@@ -1300,16 +1850,15 @@ class CheckerBoard(CheckerShape):
         cur_unit = list(init_unit)
         cur_unit_pos = list(init_pos)
 
-        # Add unit cells to batches in nested for loop
+        # Add unit cells to mesh in nested for loop
         for j in range(self.dims[1]):
             for i in range(self.dims[0]):
 
                 cur_unit_rect = graphics.Rect(cur_unit_pos, cur_unit,
                                               anchor=self.anchor)
-                cur_unit_rect.col = self.cols[(i + j) % 2]
-                cur_unit_rect.add_to_batch(self._batches[0])
-                cur_unit_rect.col = self.cols[(i + j + 1) % 2]
-                cur_unit_rect.add_to_batch(self._batches[1])
+                indices += [len(verts) // 2 + k for k in
+                            geometry.RECT_INDICES]
+                verts += cur_unit_rect.concat_verts()
 
                 # Increase x values
                 cur_unit_pos[0] += \
@@ -1325,30 +1874,91 @@ class CheckerBoard(CheckerShape):
                 graphics.locations[self.anchor][1] * cur_unit[1]
             cur_unit[1] += unit_grad[1]
 
-        self._computed = True
-
-    def draw(self, photoburst=False, always_compute=False):
-        """Draws appropriate batch depending on current phase.
+        return verts, indices
+
+    def _compute_quad(self):
+        """Returns a quad that draws the board in a fragment shader."""
+        loc = graphics.locations[self.anchor]
+        bounds, first_unit, unit_grad = [], [], []
+        for axis in range(2):
+            origins, sizes = geometry.axis_cells(self.dims[axis],
+                                                 self.init_unit[axis],
+                                                 self.end_unit[axis],
+                                                 self.position[axis],
+                                                 loc[axis])
+            lower = [o - (1 - loc[axis]) * u / 2.0
+                     for o, u in zip(origins, sizes)]
+            upper = [l + u for l, u in zip(lower, sizes)]
+            bounds.append((min(lower), max(upper)))
+            first_unit.append(sizes[0])
+            unit_grad.append((2 if (loc[axis] == 0) else 1) *
+                             (self.end_unit[axis] - self.init_unit[axis]) /
+                             self.dims[axis])
+        bounds = [bounds[0][0], bounds[1][0], bounds[0][1], bounds[1][1]]
+        return graphics.CheckerQuad(self.dims, first_unit, unit_grad,
+                                    self.position, loc, bounds, self.cols)
+
+    def recolor(self):
+        """Computes vertex colors of both phases without touching geometry."""
+        if self._grid != None:
+            loc = graphics.locations[self.anchor]
+            self._col_arrays = geometry.grid_cols(self.dims, self.cols, loc)
+        elif geometry.available:
+            self._col_arrays = geometry.board_cols(self.dims, self.cols)
+        else:
+            self._col_arrays = [[c for j in range(self.dims[1])
+                                 for i in range(self.dims[0])
+                                 for c in self.cols[(i + j + n) % 2] * 4]
+                                for n in range(2)]
+        self._quad.cols = self.cols
+        self._colored = True
+        # Force colors to be copied into the vertex list on next draw
+        self._drawn_n = None
+
+    def draw(self, photoburst=False, always_compute=False, shaders=False):
+        """Draws batch in the colors of the current phase.
 
         photoburst -- draw first color for only one frame for testing purposes
 
         always_compute -- recompute what the checkerboard should look like
         every frame
 
+        shaders -- draw a single quad using a fragment shader instead,
+        falling back to the mesh if the shader cannot be compiled
+
+        """
+        if always_compute:
+            self.compute()
+        n = self._engine.bit(self._count)
+        self.draw_phase(n, self.flipped, photoburst, shaders)
+
+    def draw_phase(self, n, flipped=False, photoburst=False, shaders=False):
+        """Draws batch in the colors of phase n, i.e. cell (0, 0) in cols[n].
+
+        flipped -- whether the colors just reversed, used by photoburst
+
         """
-        if not self._computed or always_compute:
+        if not self._computed:
             self.compute()
-        self._cur_phase %= 360
-        n = int(self._cur_phase // 180)
-        if photoburst and n == 0 and not self.flipped:
-            n = 1
-        self._batches[n].draw()
+        elif not self._colored:
+            self.recolor()
+        if photoburst:
+            n = photoburst_phase(n, flipped)
+        if shaders:
+            try:
+                self._quad.draw(n % 2)
+                return
+            except graphics.ShaderError:
+                # Draw the mesh if the shader cannot be compiled
+                pass
+        if n != self._drawn_n:
+            graphics.copy_array(self._vertex_list.colors, self._col_arrays[n])
+            self._drawn_n = n
+        self._batch.draw()
 
     def lazydraw(self):
         """Only draws on color reversal."""
-        cur_n = int(self._cur_phase // 180)
-        prev_n = int(self._prev_phase // 180)
-        if (cur_n != prev_n) or self._first_draw:
+        if self.flipped or self._first_draw:
             self.draw()
         if self._first_draw:
             self._first_draw = False
@@ -0,0 +1,91 @@
+"""Encodes and writes exported frames in background threads.
+
+Rendering and reading back a frame has to happen in the thread that
+owns the GL context, but compressing it and writing it to disk do not.
+zlib and file writes release the GIL, so a few threads are enough to
+keep several cores busy while the next frames are being drawn.
+
+Classes:
+FrameWriter -- Bounded queue of frames and the threads that write them.
+
+"""
+
+import sys
+import threading
+import Queue
+
+try:
+    import multiprocessing
+    CPU_COUNT = multiprocessing.cpu_count()
+except (ImportError, NotImplementedError):
+    CPU_COUNT = 1
+
+import pngfile
+
+class FrameWriter:
+    """Bounded queue of raw frames and the threads that write them."""
+
+    def __init__(self, threads=None, depth=None, write=pngfile.write):
+        """Starts the encoder threads.
+
+        threads -- number of encoder threads, one per core if None
+
+        depth -- maximum number of frames waiting to be written, which
+        caps the memory used by the queue, twice the number of threads
+        if None
+
+        write -- function called with the arguments of put to write a
+        frame, which must be safe to call from several threads unless
+        there is only one
+
+        """
+        if threads == None:
+            threads = CPU_COUNT
+        if depth == None:
+            depth = 2 * threads
+        if threads < 1 or depth < 1:
+            msg = 'number of threads and queue depth must be positive'
+            raise ValueError(msg)
+        self.queue = Queue.Queue(depth)
+        self.write = write
+        self.error = None
+        self.threads = [threading.Thread(target=self._work)
+                        for n in range(threads)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def _work(self):
+        """Writes frames from the queue until told to stop."""
+        while True:
+            job = self.queue.get()
+            if job == None:
+                break
+            if self.error == None:
+                try:
+                    self.write(*job)
+                except:
+                    self.error = sys.exc_info()
+
+    def _check(self):
+        """Reraises the first error that occured in an encoder thread."""
+        if self.error != None:
+            raise self.error[0], self.error[1], self.error[2]
+
+    def put(self, *job):
+        """Queues a frame to be written, blocking while the queue is full.
+
+        By default, the arguments are the path, width and height of a PNG
+        file and a string of its RGB bytes.
+
+        """
+        self._check()
+        self.queue.put(job)
+
+    def close(self):
+        """Waits for all queued frames to be written and stops threads."""
+        for thread in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self._check()
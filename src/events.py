@@ -0,0 +1,83 @@
+"""Compact representation of the events that happen on a frame.
+
+Events are kept as the bits of a single integer, so that they can be set
+with a bitwise or and cleared for the next frame by assigning a constant,
+without allocating any dicts or sets while a run is displayed.
+
+Bits:
+BLK_ON, BLK_OFF -- start and end of a block of display groups
+TRACK_ON, TRACK_OFF -- eyetracker gains or loses track of the eye
+FIX_ON, FIX_OFF -- subject starts or stops fixating on the cross
+GRP_ON, GRP_OFF -- start and end of a display group
+SIDS -- some shape of the current group has flipped fpst times
+SID_SHIFT -- lowest of the bits set for shapes 0 to SID_COUNT - 1
+ORD_SHIFT -- order id + 1, if sent on this frame, is stored from here on
+
+"""
+
+BLK_ON = 1 << 0
+BLK_OFF = 1 << 1
+TRACK_ON = 1 << 2
+TRACK_OFF = 1 << 3
+FIX_ON = 1 << 4
+FIX_OFF = 1 << 5
+GRP_ON = 1 << 6
+GRP_OFF = 1 << 7
+SIDS = 1 << 8
+SID_SHIFT = 9
+SID_COUNT = 4
+ORD_SHIFT = SID_SHIFT + SID_COUNT
+
+def sid_bits(sids):
+    """Returns event bits for the ids of shapes that have flipped."""
+    bits = 0
+    if len(sids) > 0:
+        bits = SIDS
+        for sid in sids:
+            if sid < SID_COUNT:
+                bits |= 1 << (SID_SHIFT + sid)
+    return bits
+
+def ord_bits(ord_id):
+    """Returns event bits for sending the order id of a run."""
+    if ord_id == None:
+        return 0
+    return (ord_id + 1) << ORD_SHIFT
+
+def code_table():
+    """Returns trigger values of all events below the order id bits.
+
+    Indexing the table with an event mask gives the same value as
+    encode, provided no order id is being sent.
+
+    """
+    return [encode(events) for events in range(1 << ORD_SHIFT)]
+
+def encode(events):
+    """Hard code specific trigger values for events."""
+    code = 0
+    if events >> ORD_SHIFT:
+        code = events >> ORD_SHIFT
+    elif events & BLK_ON:
+        code = 128
+    elif events & BLK_OFF:
+        code = 127
+    else:
+        et_state = 0
+        if events & FIX_ON:
+            et_state = 4
+        elif events & TRACK_ON:
+            et_state = 2
+        if events & TRACK_OFF:
+            et_state = 1
+        elif events & FIX_OFF:
+            et_state = 2
+        if events & GRP_ON:
+            code = 100 + et_state
+        elif events & GRP_OFF:
+            code = 90 + et_state
+        elif et_state > 0:
+            code = 110 + et_state
+        elif events & SIDS:
+            code = ((events >> SID_SHIFT) & ((1 << SID_COUNT) - 1)) + 16
+    return code
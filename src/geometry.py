@@ -0,0 +1,159 @@
+"""Computes checkerboard geometry as flat arrays using NumPy.
+
+All cells of a board are computed in a handful of array operations
+instead of one Rect per cell, producing exactly the same vertex positions
+as graphics.Rect for every anchor in graphics.locations.
+
+"""
+
+try:
+    import numpy
+    available = True
+except ImportError:
+    available = False
+
+# Order in which graphics.Rect emits the corners of a rectangle
+RECT_INDICES = [0, 1, 2, 1, 2, 3]
+
+def axis_cells(n, init_unit, end_unit, position, loc):
+    """Returns origins and sizes of cells along one axis of a board.
+
+    The unit size gradient and cell origins are accumulated with Decimal
+    arithmetic exactly as CheckerBoard.compute has always done, so only
+    n values need to be computed per axis instead of one per cell.
+
+    n -- number of cells along the axis
+
+    init_unit, end_unit, position -- Decimal values for the axis
+
+    loc -- anchor flag for the axis as found in graphics.locations
+
+    """
+    unit_grad = (2 if (loc == 0) else 1) * (end_unit - init_unit) / n
+    cur_unit = init_unit + unit_grad / 2
+    cur_pos = position
+    origins, sizes = [], []
+    for i in range(n):
+        origins.append(float(cur_pos))
+        sizes.append(float(cur_unit))
+        cur_pos += loc * cur_unit
+        cur_unit += unit_grad
+    return origins, sizes
+
+if available:
+
+    def axis_bounds(n, init_unit, end_unit, position, loc):
+        """Returns lower and upper pixel bounds of cells along one axis."""
+        origins, sizes = axis_cells(n, init_unit, end_unit, position, loc)
+        origins = numpy.array(origins, dtype=numpy.float64)
+        sizes = numpy.array(sizes, dtype=numpy.float64)
+        # Same float operations as graphics.Rect, elementwise
+        lower = origins - (1 - loc) * sizes / 2.0
+        upper = lower + sizes
+        return lower, upper
+
+    def board_verts(dims, init_unit, end_unit, position, loc):
+        """Returns vertices of all cells of a board as a flat float32 array.
+
+        Cells are ordered row by row, each with its four corners in the
+        order used by graphics.Rect. loc is the anchor of the board as
+        found in graphics.locations.
+
+        """
+        x0, x1 = axis_bounds(dims[0], init_unit[0], end_unit[0],
+                             position[0], loc[0])
+        y0, y1 = axis_bounds(dims[1], init_unit[1], end_unit[1],
+                             position[1], loc[1])
+        verts = numpy.empty((dims[1], dims[0], 4, 2), dtype=numpy.float32)
+        verts[:, :, 0:2, 0] = x0[numpy.newaxis, :, numpy.newaxis]
+        verts[:, :, 2:4, 0] = x1[numpy.newaxis, :, numpy.newaxis]
+        verts[:, :, 0::2, 1] = y0[:, numpy.newaxis, numpy.newaxis]
+        verts[:, :, 1::2, 1] = y1[:, numpy.newaxis, numpy.newaxis]
+        return verts.ravel()
+
+    def board_indices(dims):
+        """Returns triangle indices for all cells of a board."""
+        n = dims[0] * dims[1]
+        offsets = numpy.arange(0, 4 * n, 4, dtype=numpy.uint32)
+        indices = (offsets[:, numpy.newaxis] +
+                   numpy.array(RECT_INDICES, dtype=numpy.uint32))
+        return indices.ravel()
+
+    def board_cols(dims, cols):
+        """Returns per-vertex colors of a board for both phases.
+
+        The first array colors cell (i, j) with cols[(i + j) % 2], the
+        second with the opposite color.
+
+        """
+        parity = numpy.add.outer(numpy.arange(dims[1]),
+                                 numpy.arange(dims[0])) % 2
+        palette = numpy.array(cols, dtype=numpy.uint8)
+        return [numpy.repeat(palette[(parity + n) % 2].reshape(-1, 3),
+                             4, axis=0).ravel() for n in range(2)]
+
+    def grid_bounds(dims, init_unit, end_unit, position, loc):
+        """Returns ascending cell boundaries of a board along both axes.
+
+        Neighbouring cells can only share corner vertices if they abut
+        exactly once converted to float32. Returns None if they do not,
+        which is always the case for mid anchors since cells there are
+        nested instead of placed side by side.
+
+        """
+        bounds = []
+        for axis in range(2):
+            if loc[axis] == 0:
+                return None
+            lower, upper = axis_bounds(dims[axis], init_unit[axis],
+                                       end_unit[axis], position[axis],
+                                       loc[axis])
+            lower = lower.astype(numpy.float32)
+            upper = upper.astype(numpy.float32)
+            if loc[axis] < 0:
+                lower, upper = lower[::-1], upper[::-1]
+            if not numpy.array_equal(upper[:-1], lower[1:]):
+                return None
+            bounds.append(numpy.append(lower, upper[-1]))
+        return bounds
+
+    def grid_verts(bounds):
+        """Returns corner vertices of a grid as a flat float32 array."""
+        x, y = bounds
+        verts = numpy.empty((len(y), len(x), 2), dtype=numpy.float32)
+        verts[:, :, 0] = x[numpy.newaxis, :]
+        verts[:, :, 1] = y[:, numpy.newaxis]
+        return verts.ravel()
+
+    def grid_indices(dims):
+        """Returns triangle indices for all cells of a grid mesh.
+
+        Both triangles of a cell share the same diagonal as graphics.Rect
+        and end on the cell's bottom right corner, which no other cell
+        ends on. With flat shading that corner provides the cell color.
+
+        """
+        width = dims[0] + 1
+        lower = numpy.arange(dims[1])[:, numpy.newaxis] * width
+        left = (lower + numpy.arange(dims[0])).astype(numpy.uint32).ravel()
+        corners = [left, left + width, left + 1, left + width + 1]
+        indices = numpy.array([corners[k] for k in [0, 1, 2, 1, 3, 2]])
+        return indices.T.ravel()
+
+    def grid_cols(dims, cols, loc):
+        """Returns per-vertex colors of a grid mesh for both phases.
+
+        Each vertex takes the color of the cell whose provoking vertex it
+        is. Vertices on the top row and left column provoke no triangles.
+
+        """
+        i = numpy.arange(dims[0] + 1) - 1
+        j = numpy.arange(dims[1] + 1)
+        # Map ascending positions back to cell indices along each axis
+        if loc[0] < 0:
+            i = dims[0] - 1 - i
+        if loc[1] < 0:
+            j = dims[1] - 1 - j
+        parity = numpy.add.outer(j, i) % 2
+        palette = numpy.array(cols, dtype=numpy.uint8)
+        return [palette[(parity + n) % 2].ravel() for n in range(2)]
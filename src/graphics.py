@@ -1,13 +1,14 @@
 """Functions for drawing simple 2D shapes, both onscreen and offscreen."""
 
+import sys
 import ctypes
 
 import pyglet
+# Importing pyglet.gl would open a hidden window right away, which needs
+# a display even for exports drawn without OpenGL, see shared_context
+pyglet.options['shadow_window'] = False
 from pyglet.gl import *
-
-if not gl_info.have_extension('GL_EXT_framebuffer_object'):
-    msg = 'framebuffer extension not available in this OpenGL implementation'
-    raise NotImplementedError(msg)
+import pyglet.window
 
 locations = {'topleft': (1, -1), 'topright': (-1, -1),
              'bottomleft': (1, 1), 'bottomright': (-1, 1),
@@ -15,6 +16,37 @@ locations = {'topleft': (1, -1), 'topright': (-1, -1),
              'midleft': (1, 0), 'midright': (-1, 0),
              'center': (0, 0)}
 
+def shared_context():
+    """Makes the OpenGL context that all windows share current.
+
+    It belongs to a hidden window, which pyglet normally creates as soon
+    as pyglet.gl is imported. Here it is only created once OpenGL is
+    needed, if no context is current yet, so that software exports run
+    without a display.
+
+    """
+    if pyglet.gl._shadow_window != None:
+        pyglet.gl._shadow_window.switch_to()
+    elif pyglet.gl.current_context == None:
+        pyglet.options['shadow_window'] = True
+        pyglet.gl._create_shadow_window()
+
+def have_framebuffers():
+    """Returns true if framebuffer objects are available for offscreen
+    drawing in the current OpenGL context."""
+    return gl_info.have_extension('GL_EXT_framebuffer_object')
+
+def have_pixel_buffers():
+    """Returns true if pixel buffer objects are available for reading
+    back pixels asynchronously in the current OpenGL context."""
+    return (gl_info.have_version(2, 1) or
+            gl_info.have_extension('GL_ARB_pixel_buffer_object'))
+
+def flip_rows(data, stride):
+    """Returns image data with its rows of stride bytes in reverse order."""
+    return ''.join([data[n:n+stride]
+                    for n in range(len(data) - stride, -1, -stride)])
+
 def set_clear_color(color=(0,)*3):
     """Set the color OpenGL contexts such as windows will clear to."""
     clamped_color = [c / 255.0 for c in color if type(c) == int]
@@ -34,6 +66,258 @@ def get_window_image_data(window):
         pyglet.image.get_buffer_manager().get_color_buffer().get_image_data()
     return ImageData 
 
+def get_texture_data(Texture):
+    """Returns contents of a texture as RGB bytes, rows from the top."""
+    ImageData = Texture.get_image_data()
+    return ImageData.get_data('RGB', -Texture.width * 3)
+
+def copy_array(dest, data):
+    """Copies a sequence or NumPy array into a vertex array.
+
+    NumPy arrays are copied in one go if dest is a ctypes array, while
+    interleaved buffer regions are filled element by element.
+
+    """
+    if hasattr(data, 'ctypes') and isinstance(dest, ctypes.Array):
+        if data.nbytes != ctypes.sizeof(dest):
+            msg = 'array size does not match destination'
+            raise ValueError(msg)
+        ctypes.memmove(dest, data.ctypes.data, data.nbytes)
+    elif hasattr(data, 'tolist'):
+        dest[:] = data.tolist()
+    else:
+        dest[:] = data
+
+def add_mesh_to_batch(Batch, verts, indices, cols, group=None):
+    """Adds an indexed triangle mesh given as flat arrays to a Batch.
+
+    verts -- flat sequence of 2D vertex coordinates, preferably a float32
+    NumPy array so that it can be copied directly into the vertex list
+
+    indices -- triangle indices into the vertices
+
+    cols -- flat sequence of RGB vertex colors, preferably a uint8 array
+
+    Colors are kept in a buffer of their own, which is not interleaved
+    with the vertices, so that they can be swapped in with one copy.
+
+    """
+    if hasattr(indices, 'tolist'):
+        indices = indices.tolist()
+    VertexList = Batch.add_indexed(len(verts) // 2, GL_TRIANGLES, group,
+                                   indices, 'v2f/static', 'c3B/dynamic')
+    copy_array(VertexList.vertices, verts)
+    copy_array(VertexList.colors, cols)
+    return VertexList
+
+class FlatShadingGroup(pyglet.graphics.Group):
+    """Draws triangles in the color of their last (provoking) vertex."""
+
+    def set_state(self):
+        glShadeModel(GL_FLAT)
+
+    def unset_state(self):
+        glShadeModel(GL_SMOOTH)
+
+CHECKER_VERT = """#version 110
+varying vec2 pos;
+
+void main()
+{
+    pos = gl_Vertex.xy;
+    gl_Position = gl_ModelViewProjectionMatrix * gl_Vertex;
+}
+"""
+
+CHECKER_FRAG = """#version 110
+uniform vec2 dims;
+uniform vec2 position;
+uniform vec2 loc;
+uniform vec2 first_unit;
+uniform vec2 unit_grad;
+uniform vec3 col0;
+uniform vec3 col1;
+uniform float phase;
+varying vec2 pos;
+
+/* Returns index of the visible cell covering p along one axis, or -1. */
+float cell(float p, float n, float p0, float l, float c, float g)
+{
+    float k;
+    if (l == 0.0) {
+        /* Nested cells centered on p0, the last one drawn is visible */
+        float d = 2.0 * abs(p - p0);
+        if (c + g * (n - 1.0) > d)
+            return n - 1.0;
+        if (g >= 0.0)
+            return -1.0;
+        return ceil((d - c) / g) - 1.0;
+    }
+    /* Cells side by side, cell k starts at k * c + g * k * (k - 1) / 2 */
+    float s = (p - p0) * l;
+    if (s < 0.0)
+        return -1.0;
+    float b = c - 0.5 * g;
+    if (abs(g) * 1.0e6 < c)
+        k = floor(s / c);
+    else
+        k = floor((sqrt(max(b * b + 2.0 * g * s, 0.0)) - b) / g);
+    /* Correct rounding errors of the closed form */
+    if (k * c + 0.5 * g * k * (k - 1.0) > s)
+        k -= 1.0;
+    else if ((k + 1.0) * c + 0.5 * g * (k + 1.0) * k <= s)
+        k += 1.0;
+    if (k >= n)
+        return -1.0;
+    return k;
+}
+
+void main()
+{
+    float i = cell(pos.x, dims.x, position.x, loc.x,
+                   first_unit.x, unit_grad.x);
+    float j = cell(pos.y, dims.y, position.y, loc.y,
+                   first_unit.y, unit_grad.y);
+    if (i < 0.0 || j < 0.0)
+        discard;
+    if (mod(i + j + phase, 2.0) < 0.5)
+        gl_FragColor = vec4(col0, 1.0);
+    else
+        gl_FragColor = vec4(col1, 1.0);
+}
+"""
+
+_checker_program = None
+_checker_error = None
+
+def have_shaders():
+    """Returns true if the current context supports GLSL shaders."""
+    return gl_info.have_version(2, 0)
+
+class ShaderError(Exception):
+    """Raised when a shader fails to compile or link."""
+    pass
+
+class ShaderProgram:
+
+    def __init__(self, vert_src, frag_src):
+        """Compiles and links a GLSL program from vertex and fragment source."""
+        self.id = glCreateProgram()
+        self._locations = {}
+        for kind, src in [(GL_VERTEX_SHADER, vert_src),
+                          (GL_FRAGMENT_SHADER, frag_src)]:
+            shader = glCreateShader(kind)
+            buff = ctypes.create_string_buffer(src)
+            c_src = ctypes.cast(ctypes.pointer(ctypes.pointer(buff)),
+                                ctypes.POINTER(ctypes.POINTER(GLchar)))
+            glShaderSource(shader, 1, c_src, None)
+            glCompileShader(shader)
+            status = GLint()
+            glGetShaderiv(shader, GL_COMPILE_STATUS, ctypes.byref(status))
+            if not status.value:
+                msg = 'shader compilation failed: ' + \
+                    self._info_log(shader, glGetShaderiv, glGetShaderInfoLog)
+                raise ShaderError(msg)
+            glAttachShader(self.id, shader)
+            glDeleteShader(shader)
+        glLinkProgram(self.id)
+        status = GLint()
+        glGetProgramiv(self.id, GL_LINK_STATUS, ctypes.byref(status))
+        if not status.value:
+            msg = 'shader linking failed: ' + \
+                self._info_log(self.id, glGetProgramiv, glGetProgramInfoLog)
+            raise ShaderError(msg)
+
+    @staticmethod
+    def _info_log(obj, get_iv, get_log):
+        length = GLint()
+        get_iv(obj, GL_INFO_LOG_LENGTH, ctypes.byref(length))
+        buff = ctypes.create_string_buffer(max(length.value, 1))
+        get_log(obj, length, None, 
+                ctypes.cast(buff, ctypes.POINTER(GLchar)))
+        return buff.value
+
+    def use(self):
+        """Makes this the program used for drawing."""
+        glUseProgram(self.id)
+
+    def stop(self):
+        """Returns to fixed function drawing."""
+        glUseProgram(0)
+
+    def uniformf(self, name, *values):
+        """Sets a float, vec2 or vec3 uniform of the program in use."""
+        if name not in self._locations:
+            c_name = ctypes.cast(ctypes.c_char_p(name),
+                                 ctypes.POINTER(GLchar))
+            self._locations[name] = glGetUniformLocation(self.id, c_name)
+        setters = {1: glUniform1f, 2: glUniform2f, 3: glUniform3f}
+        setters[len(values)](self._locations[name], *values)
+
+def get_checker_program():
+    """Returns the checkerboard shader program, compiling it if necessary.
+
+    Raises ShaderError if shaders are unavailable or the program fails
+    to compile or link, without trying again on later calls.
+
+    """
+    global _checker_program, _checker_error
+    if _checker_error != None:
+        raise ShaderError(_checker_error)
+    if _checker_program == None:
+        if not have_shaders():
+            _checker_error = 'shaders not available'
+            raise ShaderError(_checker_error)
+        try:
+            _checker_program = ShaderProgram(CHECKER_VERT, CHECKER_FRAG)
+        except ShaderError:
+            _checker_error = str(sys.exc_value)
+            raise
+    return _checker_program
+
+class CheckerQuad:
+
+    def __init__(self, dims, first_unit, unit_grad, position, loc,
+                 bounds, cols):
+        """Creates a single quad that draws a checkerboard in a shader.
+
+        dims -- [columns, rows] of cells of the board
+
+        first_unit -- [width, height] of the first cell in pixels
+
+        unit_grad -- [x, y] change in cell size from one cell to the next
+
+        position -- [x,y] position of the board origin in pixels
+
+        loc -- anchor flags of the board as found in locations
+
+        bounds -- [x0, y0, x1, y1] bounding box of the board in pixels
+
+        cols -- the two colors of the board as 3-tuples
+
+        """
+        self.uniforms = [('dims', dims), ('first_unit', first_unit),
+                         ('unit_grad', unit_grad), ('position', position),
+                         ('loc', loc)]
+        self.uniforms = [(name, tuple([float(v) for v in values]))
+                         for name, values in self.uniforms]
+        x0, y0, x1, y1 = [float(b) for b in bounds]
+        self.verts = (x0, y0, x0, y1, x1, y0, x1, y1)
+        self.cols = cols
+
+    def draw(self, phase=0):
+        """Draws the board with cell (0, 0) in cols[phase]."""
+        program = get_checker_program()
+        program.use()
+        for name, values in self.uniforms:
+            program.uniformf(name, *values)
+        for name, col in zip(['col0', 'col1'], self.cols):
+            program.uniformf(name, *[c / 255.0 for c in col])
+        program.uniformf('phase', float(phase))
+        pyglet.graphics.draw_indexed(4, GL_TRIANGLES, [0, 1, 2, 1, 2, 3],
+                                     ('v2f', self.verts))
+        program.stop()
+
 class FramebufferIncompleteError(Exception):
     pass
 
@@ -43,11 +327,70 @@ class Framebuffer:
 
     def __init__(self, Texture=None):
         """Creates a new framebuffer object. Attaches texture if specified."""
+        if not have_framebuffers():
+            msg = ('framebuffer extension not available in this ' +
+                   'OpenGL implementation')
+            raise NotImplementedError(msg)
         self.id = GLuint()
         glGenFramebuffersEXT(1, ctypes.byref(self.id))
         if Texture != None:
             self.attach_texture(Texture)
         self._rendering = False
+        self.pbos = None
+
+    def start_readback(self, depth=2):
+        """Creates a ring of depth pixel buffer objects for read_pixels."""
+        if not have_pixel_buffers():
+            msg = ('pixel buffer objects not available in this ' +
+                   'OpenGL implementation')
+            raise NotImplementedError(msg)
+        self.pbos = (GLuint * depth)()
+        glGenBuffers(depth, self.pbos)
+        self._size = self.Texture.width * self.Texture.height * 3
+        for pbo in self.pbos:
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+            glBufferData(GL_PIXEL_PACK_BUFFER, self._size, None,
+                         GL_STREAM_READ)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self._reads = 0
+        self._mapped = 0
+
+    def read_pixels(self):
+        """Starts reading the framebuffer into the next pixel buffer.
+
+        The copy runs on the GPU while the next frames are drawn. Once
+        all pixel buffers are in use, returns the RGB bytes of the oldest
+        frame, rows from the top, and None before that.
+
+        """
+        depth = len(self.pbos)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, self.pbos[self._reads % depth])
+        glReadPixels(0, 0, self.Texture.width, self.Texture.height,
+                     GL_RGB, GL_UNSIGNED_BYTE, None)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self._reads += 1
+        if self._reads - self._mapped < depth:
+            return None
+        return self._map_pixels()
+
+    def flush_pixels(self):
+        """Returns RGB bytes of all frames read but not yet returned."""
+        frames = []
+        while self._mapped < self._reads:
+            frames.append(self._map_pixels())
+        return frames
+
+    def _map_pixels(self):
+        """Maps the oldest pixel buffer and returns a copy of its pixels."""
+        glBindBuffer(GL_PIXEL_PACK_BUFFER,
+                     self.pbos[self._mapped % len(self.pbos)])
+        address = glMapBuffer(GL_PIXEL_PACK_BUFFER, GL_READ_ONLY)
+        data = ctypes.string_at(address, self._size)
+        glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self._mapped += 1
+        return flip_rows(data, self.Texture.width * 3)
 
     def bind(self):
         """Binds framebuffer to current context."""
@@ -61,6 +404,9 @@ class Framebuffer:
         """Deletes framebuffer, after which it cannot be used."""
         self.end_render()
         self.unbind()
+        if self.pbos != None:
+            glDeleteBuffers(len(self.pbos), self.pbos)
+            self.pbos = None
         glDeleteFramebuffersEXT(1, ctypes.byref(self.id))         
         
     def attach_texture(self, Texture):
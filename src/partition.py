@@ -0,0 +1,73 @@
+"""Splits exports into contiguous ranges of frames rendered by processes.
+
+Every frame of an export can be rendered from its index alone (see
+CkgProj.render_frame), so ranges of frames can be handed to separate
+worker processes without any of them replaying the frames before its
+range. Workers are forked, so they share the project and timeline of
+the parent without having to pickle them.
+
+"""
+
+import os
+import sys
+import traceback
+
+try:
+    import multiprocessing
+    available = hasattr(os, 'fork')
+except ImportError:
+    available = False
+
+def ranges(frames, jobs):
+    """Returns contiguous (start, stop) ranges covering frames, one per job.
+
+    Ranges differ in length by at most one frame, and empty ranges are
+    left out if there are fewer frames than jobs.
+
+    """
+    size, extra = divmod(frames, jobs)
+    result = []
+    start = 0
+    for n in range(jobs):
+        stop = start + size + (1 if n < extra else 0)
+        if stop > start:
+            result.append((start, stop))
+        start = stop
+    return result
+
+def _work(target, start, stop, errors):
+    """Calls target for a range, reporting any error to the parent."""
+    try:
+        target(start, stop)
+    except:
+        errors.put((start, stop, ''.join(traceback.format_exception_only(
+                        *sys.exc_info()[:2])).strip()))
+        sys.exit(1)
+
+def run(target, frames, jobs):
+    """Calls target(start, stop) for ranges of frames in jobs processes.
+
+    Waits for all processes to finish, then raises IOError if any of
+    them failed.
+
+    """
+    if not available:
+        msg = 'parallel export requires a platform with fork()'
+        raise NotImplementedError(msg)
+    errors = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_work,
+                                       args=(target, start, stop, errors))
+               for start, stop in ranges(frames, jobs)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    failed = [worker for worker in workers if worker.exitcode != 0]
+    if len(failed) > 0:
+        if not errors.empty():
+            start, stop, reason = errors.get()
+            msg = 'export of frames {0} to {1} failed: {2}'.\
+                format(start, stop - 1, reason)
+        else:
+            msg = '{0} export job(s) failed'.format(len(failed))
+        raise IOError(msg)
@@ -0,0 +1,82 @@
+"""Writes PNG image files, using only the standard library.
+
+Used by export engines that produce raw pixel data themselves instead
+of reading it back from OpenGL.
+
+"""
+
+import zlib
+import struct
+
+SIGNATURE = '\x89PNG\r\n\x1a\n'
+
+# Color types from the PNG specification
+RGB = 2
+PALETTE = 3
+
+def bit_depth(colors):
+    """Returns the smallest bit depth of an image with that many colors."""
+    for depth in [1, 2, 4, 8]:
+        if colors <= 2**depth:
+            return depth
+    msg = 'palette images can have at most 256 colors'
+    raise ValueError(msg)
+
+def chunk(kind, data):
+    """Returns a PNG chunk of the given kind, with length and checksum."""
+    crc = zlib.crc32(kind + data) & 0xffffffff
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', crc)
+
+def row_bytes(width, palette=None):
+    """Returns number of bytes in a row of pixels, see encode."""
+    if palette == None:
+        return width * 3
+    return (width * bit_depth(len(palette)) + 7) // 8
+
+def header(width, height, palette=None):
+    """Returns IHDR chunk of an image, followed by its PLTE chunk if any."""
+    if palette == None:
+        depth, kind = 8, RGB
+    else:
+        depth, kind = bit_depth(len(palette)), PALETTE
+    ihdr = struct.pack('>IIBBBBB', width, height, depth, kind, 0, 0, 0)
+    chunks = [chunk('IHDR', ihdr)]
+    if palette != None:
+        chunks.append(chunk('PLTE', ''.join([struct.pack('BBB', *col)
+                                             for col in palette])))
+    return ''.join(chunks)
+
+def compress(width, height, data, level=6, palette=None):
+    """Returns compressed image data, as stored in IDAT chunks."""
+    stride = row_bytes(width, palette)
+    if len(data) != stride * height:
+        msg = 'image data does not match image size'
+        raise ValueError(msg)
+    # Filter type 0 (none) in front of every row
+    rows = ''.join(['\x00' + data[n:n+stride]
+                    for n in range(0, len(data), stride)])
+    return zlib.compress(rows, level)
+
+def encode(width, height, data, level=6, palette=None):
+    """Returns PNG file contents of an 8-bit RGB or palette image.
+
+    data -- string of width * height * 3 bytes, rows from top to bottom,
+    or of rows of palette indices packed into bit_depth(len(palette))
+    bits each, every row starting on a new byte
+
+    level -- zlib compression level
+
+    palette -- list of RGB colors the indices refer to, None for an RGB
+    image
+
+    """
+    return ''.join([SIGNATURE,
+                    header(width, height, palette),
+                    chunk('IDAT', compress(width, height, data, level,
+                                           palette)),
+                    chunk('IEND', '')])
+
+def write(path, width, height, data, level=6, palette=None):
+    """Writes an 8-bit RGB or palette image to a PNG file, see encode."""
+    with open(path, 'wb') as pngfile:
+        pngfile.write(encode(width, height, data, level, palette))
@@ -0,0 +1,92 @@
+"""Times the phases of every frame of a run, to find out why frames drop.
+
+Durations are stored into a ring buffer allocated before the run, so
+that profiling a frame only takes a clock read and an array store per
+phase, and long runs keep the most recent frames without growing.
+
+Classes:
+PhaseProfiler -- Ring buffer of how long each phase of a frame took.
+
+"""
+
+import csv
+import array
+
+from utils import *
+
+# Phases of a frame, in the order they happen in CkgRunState.update
+PHASES = ['draw',       # shapes drawn since the last frame was cleared
+          'poll',       # eyetracker polling and fixation cross drawing
+          'dispatch',   # blitting the canvas and window events
+          'flip',       # buffer swap
+          'finish',     # waiting for OpenGL to finish drawing
+          'trigger',    # sending triggers
+          'log',        # appending to the run log
+          'clear']      # clearing the window for the next frame
+DRAW, POLL, DISPATCH, FLIP, FINISH, TRIGGER, LOG, CLEAR = range(len(PHASES))
+
+# Number of most recent frames kept by default, ~18 min at 60 Hz
+PROFILE_FRAMES = 2**16
+
+# Percentiles reported by summary
+PERCENTILES = [50, 90, 99, 100]
+
+class PhaseProfiler:
+    """Ring buffer of how long each phase of a frame took."""
+
+    def __init__(self, frames=PROFILE_FRAMES):
+        """Allocates room for the durations of frames frames."""
+        self.size = frames
+        self.phases = len(PHASES)
+        self.durations = array.array('d', [0.0]) * (frames * self.phases)
+        self.clock = monotonic
+        self.count = 0
+        self._base = 0
+        self.last = self.clock()
+
+    def mark(self, phase):
+        """Ends phase of the current frame, given by its index in PHASES."""
+        now = self.clock()
+        self.durations[self._base + phase] = now - self.last
+        self.last = now
+
+    def next_frame(self):
+        """Moves on to the next frame, overwriting the oldest if full."""
+        self.count += 1
+        self._base = (self.count % self.size) * self.phases
+
+    def frames(self):
+        """Returns durations of each kept frame, oldest first."""
+        kept = min(self.count, self.size)
+        first = self.count - kept
+        rows = []
+        for n in range(first, self.count):
+            base = (n % self.size) * self.phases
+            rows.append(self.durations[base:base + self.phases].tolist())
+        return rows
+
+    def summary(self):
+        """Returns lines of per-phase percentiles in milliseconds."""
+        rows = self.frames()
+        lines = ['phase'.ljust(10) +
+                 ''.join([('p' + str(p)).rjust(10) for p in PERCENTILES])]
+        if len(rows) == 0:
+            return lines
+        for n, name in enumerate(PHASES):
+            values = sorted([row[n] for row in rows])
+            line = name.ljust(10)
+            for p in PERCENTILES:
+                value = values[min(len(values) * p // 100, len(values) - 1)]
+                line += '{0:.3f}'.format(value * 1000).rjust(10)
+            lines.append(line)
+        return lines
+
+    def write(self, path):
+        """Writes durations of each kept frame in milliseconds to path."""
+        with open(path, 'wb') as proffile:
+            writer = csv.writer(proffile, dialect='excel-tab')
+            writer.writerow(['frame'] + PHASES)
+            first = self.count - min(self.count, self.size)
+            for n, row in enumerate(self.frames()):
+                writer.writerow([first + n] +
+                                ['{0:.4f}'.format(d * 1000) for d in row])
@@ -0,0 +1,103 @@
+"""Detects dropped frames of a displayed run and sums them up by group.
+
+The real refresh interval of the display is measured by flipping a blank
+window a few times before the run. During the run, any frame that takes
+much longer than that to flip was shown for more than one refresh, i.e.
+at least one frame was dropped.
+
+Classes:
+DropDetector -- Flags frames that took too long and what was shown.
+
+"""
+
+from utils import *
+
+# Number of blank flips timed before the run
+WARMUP_FRAMES = 30
+
+# Frames lasting longer than this many refresh intervals count as dropped
+DROP_FACTOR = 1.5
+
+class DropDetector:
+    """Flags frames that took too long and what was shown on them."""
+
+    def __init__(self, factor=DROP_FACTOR):
+        """Creates a detector, to be warmed up before the run starts.
+
+        factor -- frames lasting longer than factor times the refresh
+        interval count as dropped
+
+        """
+        self.clock = monotonic
+        self.factor = factor
+        self.interval = None
+        self.warmups = []
+        self.last = None
+        self.count = 0
+        # Frame count, group id, shape phases and duration of each drop
+        self.drops = []
+
+    def warmup(self):
+        """Times a blank flip before the run."""
+        now = self.clock()
+        if self.last != None:
+            self.warmups.append(now - self.last)
+        self.last = now
+
+    def start(self):
+        """Takes the median warm-up flip interval as refresh interval."""
+        if len(self.warmups) == 0:
+            msg = 'refresh interval cannot be measured without warm-up'
+            raise ValueError(msg)
+        durations = sorted(self.warmups)
+        self.interval = durations[len(durations) // 2]
+        self._limit = self.interval * self.factor
+
+    def begin(self):
+        """Times the first frame of the run from now, right before it."""
+        self.last = self.clock()
+
+    def frame(self, gid, phases):
+        """Times the flip of a frame, which just happened.
+
+        gid -- id of the group being shown, -1 for waitscreens and None
+        outside of groups
+
+        phases -- phase of each shape drawn on the frame, None if no
+        shapes were drawn
+
+        """
+        now = self.clock()
+        duration = now - self.last
+        self.last = now
+        if duration > self._limit:
+            self.drops.append((self.count, gid, phases, duration))
+        self.count += 1
+
+    def missed(self, duration):
+        """Returns number of refreshes missed by a frame of duration."""
+        return max(int(round(duration / self.interval)) - 1, 1)
+
+    def by_group(self):
+        """Returns number of dropped frames by group id."""
+        counts = {}
+        for count, gid, phases, duration in self.drops:
+            counts[gid] = counts.get(gid, 0) + self.missed(duration)
+        return counts
+
+    def summary(self):
+        """Returns lines summing up the quality of the run."""
+        lines = ['refresh interval: {0:.3f} ms ({1:.2f} Hz)'.\
+                     format(self.interval * 1000, 1 / self.interval)]
+        dropped = sum(self.by_group().values())
+        lines.append('{0} of {1} frames late, {2} frames dropped'.\
+                         format(len(self.drops), self.count, dropped))
+        for gid, dropped in sorted(self.by_group().items()):
+            if gid == None:
+                name = 'outside groups'
+            elif gid == -1:
+                name = 'waitscreens'
+            else:
+                name = 'group {0}'.format(gid)
+            lines.append('{0}: {1} dropped'.format(name, dropped))
+        return lines
@@ -0,0 +1,236 @@
+"""Draws checkergen scenes into NumPy arrays, without OpenGL.
+
+Scenes only consist of axis-aligned rectangles and crosses, so every
+shape can be filled with array slicing. Coverage follows the OpenGL
+rasterization rules for the vertices the GL path would use: a pixel is
+filled if its center lies within [lower, upper) of a shape along both
+axes, with coordinates rounded to float32 like v2f vertex data. Lines,
+which only make up crosses, follow the rules of GL_LINES instead, see
+line_span. Later shapes are drawn over earlier ones, as in the GL path.
+
+Classes:
+Canvas -- RGB pixel buffer of a frame that shapes can be drawn into.
+
+"""
+
+import math
+
+try:
+    import numpy
+    available = True
+except ImportError:
+    available = False
+
+import geometry
+import pngfile
+from graphics import locations
+
+# Fractions of a pixel vertices of lines are snapped to, as in llvmpipe
+# and most GPUs
+SUBPIXELS = 256
+
+def span(lower, upper, n):
+    """Returns first and last + 1 of n pixels with centers in [lower, upper).
+
+    Both bounds are rounded to float32 first, like vertex coordinates.
+
+    """
+    lower = float(numpy.float32(lower))
+    upper = float(numpy.float32(upper))
+    start = min(max(int(math.ceil(lower - 0.5)), 0), n)
+    stop = min(max(int(math.ceil(upper - 0.5)), start), n)
+    return start, stop
+
+def line_span(lower, upper, across, n):
+    """Returns first and last + 1 of n pixels GL_LINES draws along a line.
+
+    The line runs from lower to upper, at across on the other axis, with
+    coordinates snapped to SUBPIXELS. A pixel is drawn if the line leaves
+    the diamond of points whose distances to its center add up to less
+    than 1/2, i.e. if its center lies in (lower - e, upper - e], where e
+    is 1/2 less the distance of the line to the centers of the pixels it
+    runs over. If the line runs exactly between two rows or columns of
+    pixels, e is 0 and centers in [lower, upper) are drawn instead.
+
+    Lines ending exactly on the edge of a diamond away from its corners
+    are drawn differently by different GL implementations, hence they
+    may be a pixel longer or shorter than with OpenGL.
+
+    """
+    lower, upper, across = [round(float(numpy.float32(v)) * SUBPIXELS) /
+                            SUBPIXELS for v in (lower, upper, across)]
+    # Same pixels across the line as span(across - 0.5, across + 0.5)
+    center = math.ceil(across - 1) + 0.5
+    e = 0.5 - abs(across - center)
+    if e == 0:
+        start = int(math.ceil(lower - 0.5))
+        stop = int(math.ceil(upper - 0.5))
+    else:
+        start = int(math.floor(lower - e - 0.5)) + 1
+        stop = int(math.floor(upper - e - 0.5)) + 1
+    start = min(max(start, 0), n)
+    return start, min(max(stop, start), n)
+
+def last_cells(lower, upper, n):
+    """Returns index of the last cell covering each of n pixels, or -1."""
+    last = numpy.empty(n, dtype=numpy.int32)
+    last.fill(-1)
+    for k, (l, u) in enumerate(zip(lower, upper)):
+        start, stop = span(l, u, n)
+        last[start:stop] = k
+    return last
+
+class Canvas:
+    """RGB pixel buffer of a frame, with rows from the bottom up like GL.
+
+    Given a palette, pixels are stored as indices into it instead, and
+    saved as palette PNG images with as few bits per pixel as possible.
+
+    """
+
+    def __init__(self, res, bg=(0,)*3, palette=None):
+        """Creates a canvas filled with the background color.
+
+        palette -- list of all RGB colors that will be drawn, including
+        the background, or None to store RGB pixels
+
+        """
+        if not available:
+            msg = 'software rendering requires NumPy'
+            raise NotImplementedError(msg)
+        self.res = tuple(res)
+        self.palette = None
+        if palette == None:
+            self.pixels = numpy.empty((self.res[1], self.res[0], 3),
+                                      dtype=numpy.uint8)
+        else:
+            self.palette = [tuple(col) for col in palette]
+            self.depth = pngfile.bit_depth(len(self.palette))
+            self._indices = {}
+            for n, col in reversed(list(enumerate(self.palette))):
+                self._indices[col] = n
+            self.pixels = numpy.empty((self.res[1], self.res[0]),
+                                      dtype=numpy.uint8)
+        self.bg = self.color(bg)
+        self._boards = {}
+        self.clear()
+
+    def color(self, col):
+        """Returns the pixel value col is stored as."""
+        if self.palette == None:
+            return numpy.array(col, dtype=numpy.uint8)
+        try:
+            return self._indices[tuple(col)]
+        except KeyError:
+            msg = 'color {0} is not in the palette'.format(tuple(col))
+            raise ValueError(msg)
+
+    def clear(self):
+        """Fills the whole canvas with the background color."""
+        self.pixels[:, :] = self.bg
+
+    def fill(self, x0, y0, x1, y1, col):
+        """Fills pixels with centers in [x0, x1) x [y0, y1) with col."""
+        i0, i1 = span(x0, x1, self.res[0])
+        j0, j1 = span(y0, y1, self.res[1])
+        self.pixels[j0:j1, i0:i1] = self.color(col)
+
+    def draw_rect(self, rect):
+        """Draws a graphics.Rect."""
+        x, y = rect.x(), rect.y()
+        self.fill(x[0], y[0], x[1], y[1], rect.col)
+
+    def draw_cross(self, cross):
+        """Draws a graphics.Cross, lines being thick wide.
+
+        As with GL_LINES, pixels along each line are those of line_span,
+        and its width is rounded to a whole number of pixels, at least 1.
+
+        """
+        x, y = cross.x(), cross.y()
+        half = max(int(cross.thick + 0.5), 1) / 2.0
+        col = self.color(cross.col)
+        i0, i1 = line_span(x[0], x[1], cross.pos[1], self.res[0])
+        j0, j1 = span(cross.pos[1] - half, cross.pos[1] + half, self.res[1])
+        self.pixels[j0:j1, i0:i1] = col
+        i0, i1 = span(cross.pos[0] - half, cross.pos[0] + half, self.res[0])
+        j0, j1 = line_span(y[0], y[1], cross.pos[0], self.res[1])
+        self.pixels[j0:j1, i0:i1] = col
+
+    def _board_cells(self, board):
+        """Returns pixel bounds and cell parities of a board, cached."""
+        key = (board.dims, board.init_unit, board.end_unit,
+               board.position, board.anchor)
+        cached = self._boards.get(id(board))
+        if cached != None and cached[0] == key:
+            return cached[1]
+        loc = locations[board.anchor]
+        last = []
+        for axis in range(2):
+            lower, upper = geometry.axis_bounds(board.dims[axis],
+                                                board.init_unit[axis],
+                                                board.end_unit[axis],
+                                                board.position[axis],
+                                                loc[axis])
+            last.append(last_cells(lower, upper, self.res[axis]))
+        # Cells are drawn row by row, so the last cell covering a pixel
+        # is the last along each axis
+        cols = numpy.flatnonzero(last[0] >= 0)
+        rows = numpy.flatnonzero(last[1] >= 0)
+        if len(cols) == 0 or len(rows) == 0:
+            cells = None
+        else:
+            i = last[0][cols[0]:cols[-1]+1]
+            j = last[1][rows[0]:rows[-1]+1]
+            covered = numpy.logical_and.outer(j >= 0, i >= 0)
+            parity = numpy.add.outer(j, i) % 2
+            cells = (slice(rows[0], rows[-1] + 1),
+                     slice(cols[0], cols[-1] + 1), covered, parity)
+        self._boards[id(board)] = (key, cells)
+        return cells
+
+    def draw_board(self, board, n):
+        """Draws a CheckerBoard in the colors of phase n."""
+        cells = self._board_cells(board)
+        if cells == None:
+            return
+        rows, cols, covered, parity = cells
+        palette = numpy.array([self.color(col) for col in board.cols],
+                              dtype=numpy.uint8)
+        colors = palette[(parity + n) % 2]
+        region = self.pixels[rows, cols]
+        region[covered] = colors[covered]
+
+    def tostring(self):
+        """Returns pixels as a string of RGB bytes, rows from the top.
+
+        With a palette, each row holds the indices of its pixels packed
+        into depth bits each, as in PNG files.
+
+        """
+        rows = self.pixels[::-1]
+        if self.palette == None or self.depth == 8:
+            return rows.tostring()
+        # Pad rows to whole bytes, then pack pixels from the high bits on
+        per_byte = 8 // self.depth
+        width = -(-self.res[0] // per_byte) * per_byte
+        padded = numpy.zeros((self.res[1], width), dtype=numpy.uint8)
+        padded[:, :self.res[0]] = rows
+        pixels = padded.reshape(self.res[1], -1, per_byte)
+        packed = numpy.zeros(pixels.shape[:2], dtype=numpy.uint8)
+        for k in range(per_byte):
+            packed |= pixels[:, :, k] << numpy.uint8(8 - self.depth * (k + 1))
+        return packed.tostring()
+
+    def write(self, path, width, height, data):
+        """Writes data returned by tostring to a PNG file.
+
+        Takes the same arguments as pngfile.write, so that it can be
+        used by encoder threads.
+
+        """
+        pngfile.write(path, width, height, data, palette=self.palette)
+
+    def save(self, path):
+        """Saves canvas as a PNG file."""
+        self.write(path, self.res[0], self.res[1], self.tostring())
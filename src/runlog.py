@@ -0,0 +1,222 @@
+"""Stores the per-frame log of a run in typed arrays, one per column.
+
+Appending a frame stores plain numbers into arrays allocated for the
+whole run, instead of appending boxed floats and placeholder strings to
+Python lists, so long runs take a fraction of the memory and every
+frame costs the same. Values that were not measured are stored as NaN,
+or as 0 for triggers, and written as empty fields.
+
+A frame takes 26 bytes instead of about 100 with lists. That is as far as
+it goes: timestamps stay double precision, since single precision only
+resolves a quarter of a millisecond an hour into a run, and the other
+columns are already single precision floats and 16 bit trigger codes.
+
+For long sessions, the log can instead be streamed to disk while the
+run goes on, so that a crash loses at most the frames logged in the
+last FLUSH_INTERVAL seconds. Frames are streamed to a file of their
+own, which is copied into the log once the run is over, so that the
+log is laid out the same either way.
+
+Classes:
+RunLog -- Columns of per-frame times, triggers and eye positions.
+LogStream -- Appends per-frame log rows to a file in a background thread.
+
+"""
+
+import sys
+import csv
+import shutil
+import array
+import threading
+import collections
+import cStringIO
+
+# Stored for values that were not measured on a frame
+MISSING = float('nan')
+
+# Headers of the columns, in the order append takes them
+COLUMNS = ['timestamps', 'durations', 'triggers', 'trigger latency',
+           'eye x (mm)', 'eye y (mm)']
+
+# Array types of the columns, in the order of COLUMNS
+TYPECODES = ['d', 'f', 'H', 'f', 'f', 'f']
+
+# Significant digits written for single precision columns, so that
+# e.g. a duration of 0.01 is not written as 0.009999999776482582
+SINGLE_DIGITS = 7
+
+# Bounds of the number of frames allocated up front
+MIN_FRAMES = 1024
+MAX_FRAMES = 2**20
+
+# Seconds between batched writes of a streamed log, which bounds how
+# much of it a crash can lose
+FLUSH_INTERVAL = 0.5
+
+def measured(value):
+    """Returns value, or MISSING if it is '' or None, as for lost eyes."""
+    if value == '' or value == None:
+        return MISSING
+    return value
+
+def fields(values, trigger=2):
+    """Returns values of a frame to be written, '' where missing.
+
+    trigger -- index of the trigger code, which is missing if 0
+
+    """
+    row = list(values)
+    for n, value in enumerate(row):
+        if value != value or (n == trigger and value == 0):
+            row[n] = ''
+        elif TYPECODES[n] == 'f':
+            row[n] = float('{0:.{1}g}'.format(value, SINGLE_DIGITS))
+    return row
+
+class RunLog:
+    """Columns of per-frame times, triggers and eye positions."""
+
+    def __init__(self, frames=MIN_FRAMES):
+        """Allocates room for frames frames, grown as needed.
+
+        frames -- expected number of frames of the run
+
+        """
+        self.size = min(max(frames, MIN_FRAMES), MAX_FRAMES)
+        self.count = 0
+        columns = [array.array(code, [0 if code == 'H' else MISSING]) *
+                   self.size for code in TYPECODES]
+        (self.timestamps, self.durations, self.triggers, self.latencies,
+         self.eye_x, self.eye_y) = columns
+
+    def columns(self):
+        """Returns the arrays of all columns, in the order of COLUMNS."""
+        return [self.timestamps, self.durations, self.triggers,
+                self.latencies, self.eye_x, self.eye_y]
+
+    def grow(self):
+        """Doubles the number of frames there is room for."""
+        for column in self.columns():
+            column.extend(column[:self.size])
+        self.size *= 2
+
+    def append(self, timestamp, duration, trigger, latency, eye_x, eye_y):
+        """Logs the values of the next frame, see COLUMNS.
+
+        trigger -- trigger code sent on the frame, 0 if none
+
+        eye_x, eye_y -- may also be '' or None if the eye was not tracked
+
+        """
+        n = self.count
+        if n == self.size:
+            self.grow()
+        self.timestamps[n] = timestamp
+        self.durations[n] = duration
+        self.triggers[n] = trigger
+        self.latencies[n] = latency
+        self.eye_x[n] = measured(eye_x)
+        self.eye_y[n] = measured(eye_y)
+        self.count = n + 1
+
+    def nbytes(self):
+        """Returns number of bytes allocated for the columns."""
+        return sum([len(column) * column.itemsize
+                    for column in self.columns()])
+
+    def rows(self):
+        """Yields the values of each logged frame, '' where missing."""
+        columns = self.columns()
+        for n in xrange(self.count):
+            yield fields([column[n] for column in columns])
+
+class LogStream:
+    """Appends per-frame log rows to a file in a background thread.
+
+    Logging a frame only appends its values to a deque, which is safe to
+    share between threads without locking, so the render thread never
+    waits on the disk. Every interval, the writer thread formats all
+    queued frames, writes them in one go and flushes the file. If that
+    fails, the error is raised again by the next append, see copy.
+
+    """
+
+    def __init__(self, path, header=None, interval=FLUSH_INTERVAL):
+        """Creates the log file, writes its header and starts the thread.
+
+        header -- rows written before the column headers, if any
+
+        interval -- seconds between batched writes
+
+        """
+        header = header or []
+        self.path = path
+        self.interval = interval
+        self.count = 0
+        self.error = None
+        self.queue = collections.deque()
+        self.file = open(path, 'wb')
+        writer = csv.writer(self.file, dialect='excel-tab')
+        writer.writerows(header)
+        self.file.flush()
+        # Where the frames start, after the rows of the header
+        self.start = self.file.tell()
+        writer.writerow(COLUMNS)
+        self.file.flush()
+        self._done = threading.Event()
+        self.thread = threading.Thread(target=self._work)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def append(self, timestamp, duration, trigger, latency, eye_x, eye_y):
+        """Queues the values of the next frame, see RunLog.append."""
+        self._check()
+        self.queue.append((timestamp, duration, trigger, latency,
+                           measured(eye_x), measured(eye_y)))
+        self.count += 1
+
+    def _drain(self):
+        """Writes all queued frames in one batch and flushes the file."""
+        batch = cStringIO.StringIO()
+        writer = csv.writer(batch, dialect='excel-tab')
+        while True:
+            try:
+                values = self.queue.popleft()
+            except IndexError:
+                break
+            writer.writerow(fields(values))
+        self.file.write(batch.getvalue())
+        self.file.flush()
+
+    def _work(self):
+        """Writes queued frames every interval until told to stop."""
+        done = False
+        while not done:
+            done = self._done.wait(self.interval)
+            try:
+                self._drain()
+            except:
+                self.error = sys.exc_info()
+                break
+
+    def _check(self):
+        """Reraises the error that stopped the writer thread, if any."""
+        if self.error != None:
+            raise self.error[0], self.error[1], self.error[2]
+
+    def close(self):
+        """Writes the remaining frames, stops the thread and closes file."""
+        self._done.set()
+        self.thread.join()
+        self.file.close()
+        self._check()
+
+    def copy(self, logfile):
+        """Writes the column headers and all frames to logfile once closed.
+
+        The frames come out as RunLog.rows would write them.
+
+        """
+        with open(self.path, 'rb') as stream:
+            stream.seek(self.start)
+            shutil.copyfileobj(stream, logfile)
@@ -0,0 +1,555 @@
+"""Compiles checkergen runs into flat, integer-indexed frame schedules.
+
+All Decimal arithmetic needed to work out what happens on each frame of
+a run is done here once, before the first flip, so that the frame loop
+only has to index lists and do integer arithmetic. That includes the
+rounded Decimal phase of older versions, whose flips are replayed into
+a list of frames, see DecimalPhase.
+
+Classes:
+Timeline -- Schedule of a project run for a given order of groups.
+GroupSchedule -- Schedule of a display group, the same every time it is shown.
+CrossColors -- Index of the fixation cross color shown on any frame.
+Phase -- Exact phase of a flickering shape on any frame, in integers.
+DecimalPhase -- Phase of a flickering shape as older versions accumulated it.
+GroupState -- Phases of all shapes of a group, advanced together.
+
+"""
+
+import heapq
+import bisect
+from fractions import Fraction, gcd
+from decimal import getcontext
+
+try:
+    import numpy
+    available = True
+except ImportError:
+    available = False
+
+from utils import *
+
+# Largest number of frames a table of cross colors is built for
+MAX_CROSS_FRAMES = 2**16
+
+def to_frames(duration, fps):
+    """Returns number of frames a duration lasts, truncated like range().
+
+    Negative durations last no frames, as range() gave none for them.
+
+    """
+    return max(0, int(duration * fps))
+
+def cross_frames(cross, n, fps):
+    """Returns cross visibility changes for each of n frames.
+
+    Entries are None where visibility is left as it was, and True or
+    False where the time of the frame, count / fps, is a key of
+    dict(cross), exactly as if that lookup were done on every frame.
+
+    """
+    changes = [None] * n
+    for time, show in dict(cross).items():
+        if not time.is_finite():
+            continue
+        # Only the frames around time * fps can have exactly that time
+        exact = time * fps
+        for count in set([int(exact.to_integral_value(ROUND_FLOOR)),
+                          int(exact.to_integral_value(ROUND_CEILING))]):
+            if 0 <= count < n and to_decimal(count) / fps == time:
+                changes[count] = show
+    return changes
+
+def cross_shown(changes):
+    """Returns cross visibility on each frame, given changes by frame.
+
+    Entries are the last change made on or before that frame, or None
+    if visibility has not been changed yet.
+
+    """
+    shown = []
+    show = None
+    for change in changes:
+        if change != None:
+            show = change
+        shown.append(show)
+    return shown
+
+class CrossColors:
+    """Index of the fixation cross color shown on any frame.
+
+    The index is 0 if count % (sum(cross_times) * fps) < cross_times[0] *
+    fps and 1 otherwise, with counts scaled to integers to avoid
+    Decimals. It is looked up in a table of one period of frames, unless
+    the period is longer than limit frames, e.g. for times given to the
+    millisecond, in which case it is computed on every frame instead.
+
+    """
+
+    def __init__(self, cross_times, fps, limit=MAX_CROSS_FRAMES):
+        """Works out the cross colors of a run.
+
+        cross_times -- durations of the first and second cross color
+
+        fps -- frames per second of the run
+
+        limit -- maximum number of frames in the table
+
+        """
+        # Counts are scaled by scale, wrap around every period frames if
+        # period is not None, and show color 1 from threshold on
+        self.scale = 1
+        self.period = None
+        self.threshold = None
+        self.table = None
+        first = cross_times[0] * fps
+        if not first.is_finite():
+            # First color forever
+            return
+        total = sum(cross_times) * fps
+        first = Fraction(first)
+        if total.is_finite():
+            total = Fraction(total)
+            self.period, self.scale = total.numerator, total.denominator
+            first *= self.scale
+        # Scaled counts are integers, so comparing with the ceiling is exact
+        self.threshold = -(-first.numerator // first.denominator)
+        if self.period != None and self.period <= limit:
+            self.table = [self.compute(count) for count in range(self.period)]
+
+    def compute(self, count):
+        """Returns the color index of frame count without the table."""
+        if self.threshold == None:
+            return 0
+        scaled = count * self.scale
+        if self.period != None:
+            scaled %= self.period
+        return int(scaled >= self.threshold)
+
+    def index(self, count):
+        """Returns the color index of frame count."""
+        if self.table != None:
+            return self.table[count % self.period]
+        return self.compute(count)
+
+class Phase:
+    """Exact phase of a flickering shape on any frame, in integers.
+
+    On frame count after a reset, a shape is (start + step * count) /
+    denom half periods past a phase of 0 degrees. Its phase bit, whether
+    it just flipped and how often it has flipped so far all follow from
+    that in O(1), without accumulating anything from frame to frame.
+
+    """
+
+    def __init__(self, phase, freq=0, fps=1, int_half_periods=True):
+        """Creates the phase of a shape.
+
+        phase -- initial phase in degrees
+
+        freq -- frequency of color reversal cycles in Hz
+
+        fps -- frames per second of the run
+
+        int_half_periods -- round half periods to an integer number of
+        frames, in which case half_period holds that number
+
+        """
+        self.fps = fps
+        offset = (Fraction(to_decimal(phase)) % 360) / 180
+        self.half_period = None
+        if freq == 0:
+            rate = Fraction(0)
+        elif int_half_periods:
+            self.half_period = int(round(fps / (freq * 2)))
+            rate = Fraction(1, self.half_period)
+        else:
+            rate = Fraction(to_decimal(freq) * 2) / Fraction(to_decimal(fps))
+        self.denom = (offset.denominator * rate.denominator //
+                      gcd(offset.denominator, rate.denominator))
+        self.start = offset.numerator * (self.denom // offset.denominator)
+        self.step = rate.numerator * (self.denom // rate.denominator)
+
+    def half(self, count):
+        """Returns number of half periods completed on frame count."""
+        return (self.start + self.step * count) // self.denom
+
+    def bit(self, count):
+        """Returns 0 or 1 depending on which colors are shown on frame count."""
+        return self.half(count) % 2
+
+    def flipped(self, count):
+        """Returns true if colors reversed between frame count - 1 and count."""
+        return count > 0 and self.half(count) != self.half(count - 1)
+
+    def flips(self, count):
+        """Returns number of color reversals up to and including frame count.
+
+        Assumes at most one reversal per frame, i.e. freq <= fps / 2.
+
+        """
+        return abs(self.half(count) - self.half(0))
+
+    def flip_frame(self, m):
+        """Returns frame on which the m-th color reversal happens, or None."""
+        h = self.half(0)
+        if self.step > 0:
+            # First count with start + step * count >= (h + m) * denom
+            return -((self.start - (h + m) * self.denom) // self.step)
+        elif self.step < 0:
+            # First count with start + step * count < (h - m + 1) * denom
+            return (self.start - (h - m + 1) * self.denom) // -self.step + 1
+        return None
+
+class DecimalPhase:
+    """Phase of a flickering shape as older versions accumulated it.
+
+    Older versions added a Decimal number of degrees to the phase of a
+    shape on every frame. Where that number does not terminate, e.g. for
+    half periods of 7 frames, the sum is rounded, and a flip that is
+    exactly due on a frame can happen a frame later. To keep flips on
+    the same frames, the sum is replayed once when the phase is created,
+    keeping the frames on which colors reversed as integers, so any
+    frame is then looked up by bisection. Only phases and frequencies
+    that are not negative are replayed, see make_phase.
+
+    """
+
+    def __init__(self, phase, freq=0, fps=1, int_half_periods=True, frames=0):
+        """Creates the phase of a shape, see Phase.
+
+        frames -- number of frames to work out flips for, flips on later
+        frames are only worked out when first asked for
+
+        """
+        self.fps = fps
+        self.half_period = None
+        self.degs = None
+        if freq != 0:
+            if int_half_periods:
+                self.half_period = int(round(fps / (freq * 2)))
+                self.degs = 180 / to_decimal(self.half_period)
+                self._exact_degs = Fraction(180, self.half_period)
+            else:
+                self.degs = 360 * freq / fps
+                self._exact_degs = (360 * Fraction(to_decimal(freq)) /
+                                    Fraction(to_decimal(fps)))
+        # Drawing the first frame reduced the phase to below 360 degrees
+        self._cur = to_decimal(phase) % 360
+        self._count = 0
+        self._half0 = int(self._cur // 180)
+        self._half = self._half0
+        self.frames = []
+        if self.degs != None:
+            self._replay(frames - 1)
+
+    def exact(self):
+        """Returns true if flips happen exactly when due, as with Phase.
+
+        That is the case unless the sum of degrees is rounded, or more
+        than half a period passes between frames.
+
+        """
+        if self.degs == None:
+            return True
+        # Sums below 1000 degrees fit in the precision
+        places = getcontext().prec - 3
+        if min(self._cur.as_tuple()[2], self.degs.as_tuple()[2]) < -places:
+            return False
+        return Fraction(self.degs) == self._exact_degs and self.degs <= 180
+
+    def _replay(self, count):
+        """Adds up degrees until frame count, noting color reversals."""
+        while self._count < count:
+            self._count += 1
+            self._cur += self.degs
+            if self._cur >= 360:
+                self._cur %= 360
+            half = int(self._cur // 180)
+            if half != self._half:
+                self.frames.append(self._count)
+                self._half = half
+
+    def flips(self, count):
+        """Returns number of color reversals up to and including frame count."""
+        if self.degs == None:
+            return 0
+        if count > self._count:
+            # Twice as far each time, so later frames cost O(1) on average
+            self._replay(max(count, 2 * self._count))
+        return bisect.bisect_right(self.frames, count)
+
+    def bit(self, count):
+        """Returns 0 or 1 depending on which colors are shown on frame count."""
+        return (self._half0 + self.flips(count)) % 2
+
+    def flipped(self, count):
+        """Returns true if colors reversed between frame count - 1 and count."""
+        n = self.flips(count)
+        return n > 0 and self.frames[n-1] == count
+
+    def flip_frame(self, m):
+        """Returns frame on which the m-th color reversal happens, or None.
+
+        Only flips on frames already worked out are returned, so that
+        moving on past the frames a phase was created for adds nothing up.
+
+        """
+        if m > len(self.frames):
+            return None
+        return self.frames[m-1]
+
+def make_phase(phase, freq=0, fps=1, int_half_periods=True, frames=0):
+    """Returns the phase of a shape on any frame, see Phase.
+
+    Flips happen on the same frames as in older versions, which only
+    needs a DecimalPhase where they rounded.
+
+    frames -- number of frames a DecimalPhase works out flips for
+
+    """
+    if to_decimal(phase) >= 0 and freq > 0:
+        legacy = DecimalPhase(phase, freq, fps, int_half_periods)
+        if not legacy.exact():
+            return DecimalPhase(phase, freq, fps, int_half_periods, frames)
+    return Phase(phase, freq, fps, int_half_periods)
+
+class GroupState:
+    """Phases of all shapes of a group, advanced together.
+
+    Holds the phase bit, flip flag and flip count of every shape on the
+    current frame, along with the ids of shapes whose flip triggers are
+    due. Seeking to a frame computes all of these at once, in a few
+    array operations with NumPy, unless some shapes have a DecimalPhase,
+    whose flips are then found by bisection.
+    Advancing frame by frame only touches the shapes that flip, which
+    are taken off a heap of next flip frames.
+
+    """
+
+    # Largest integer phase parameter that cannot overflow int64 arrays
+    # within 2**31 frames, past which Python integers are used instead
+    INT64_LIMIT = 2**31
+
+    def __init__(self, phases, fpst=0):
+        """Creates the state of a group from the phase of each shape.
+
+        fpst -- flips per shape trigger, 0 to disable shape triggers
+
+        """
+        self.phases = phases
+        self.fpst = fpst
+        self.count = None
+        self._heap = None
+        self._vector = available and \
+            len([p for p in phases if not isinstance(p, Phase)]) == 0
+        if self._vector:
+            params = [p.start for p in phases] + [p.step for p in phases] + \
+                [p.denom for p in phases]
+            if max([abs(x) for x in params] + [0]) < self.INT64_LIMIT:
+                dtype = numpy.int64
+            else:
+                dtype = object
+            self._start = numpy.array([p.start for p in phases], dtype=dtype)
+            self._step = numpy.array([p.step for p in phases], dtype=dtype)
+            self._denom = numpy.array([p.denom for p in phases], dtype=dtype)
+            self._half0 = self._half(0)
+
+    def _half(self, count):
+        """Returns array of half periods completed by each shape."""
+        return (self._start + self._step * count) // self._denom
+
+    def seek(self, count):
+        """Sets bits, flipped, flips and sids to their values on frame count."""
+        self.count = count
+        self._heap = None
+        if self._vector:
+            cur = self._half(count)
+            if count > 0:
+                flipped = cur != self._half(count - 1)
+            else:
+                flipped = numpy.zeros(len(self.phases), dtype=bool)
+            flips = abs(cur - self._half0)
+            if self.fpst > 0:
+                due = flipped & (flips % self.fpst == 0)
+                self.sids = tuple(numpy.flatnonzero(due).tolist())
+            else:
+                self.sids = ()
+            self.bits = (cur % 2).tolist()
+            self.flipped = flipped.tolist()
+            self.flips = flips.tolist()
+        else:
+            self.bits = [p.bit(count) for p in self.phases]
+            self.flipped = [p.flipped(count) for p in self.phases]
+            self.flips = [p.flips(count) for p in self.phases]
+            if self.fpst > 0:
+                self.sids = tuple([n for n, f in enumerate(self.flipped)
+                                   if f and self.flips[n] % self.fpst == 0])
+            else:
+                self.sids = ()
+        self._flipped_ids = [n for n, f in enumerate(self.flipped) if f]
+
+    def advance(self, count):
+        """Moves state to frame count, doing nothing if already there.
+
+        Moving on to the next frame only updates shapes that flip on it,
+        any other move seeks.
+
+        """
+        if count == self.count:
+            return
+        if self.count == None or count != self.count + 1:
+            self.seek(count)
+            return
+        if self._heap == None:
+            self._heap = []
+            for n, phase in enumerate(self.phases):
+                frame = phase.flip_frame(self.flips[n] + 1)
+                if frame != None:
+                    self._heap.append((frame, n))
+            heapq.heapify(self._heap)
+        self.count = count
+        for n in self._flipped_ids:
+            self.flipped[n] = False
+        self._flipped_ids = []
+        sids = []
+        heap = self._heap
+        while len(heap) > 0 and heap[0][0] == count:
+            frame, n = heapq.heappop(heap)
+            self.bits[n] ^= 1
+            self.flipped[n] = True
+            self.flips[n] += 1
+            self._flipped_ids.append(n)
+            if self.fpst > 0 and self.flips[n] % self.fpst == 0:
+                sids.append(n)
+            frame = self.phases[n].flip_frame(self.flips[n] + 1)
+            if frame != None:
+                heapq.heappush(heap, (frame, n))
+        self.sids = tuple(sorted(sids))
+
+class GroupSchedule:
+    """Frame schedule of a display group, the same every time it is shown."""
+
+    def __init__(self, group, fps, fpst=0):
+        """Compiles the schedule of a group.
+
+        group -- CkgDisplayGroup to compile
+
+        fps -- frames per second of the run
+
+        fpst -- flips per shape trigger, 0 to disable shape triggers
+
+        """
+        self.pre = to_frames(group.pre, fps)
+        self.disp = to_frames(group.disp, fps)
+        self.post = to_frames(group.post, fps)
+        self.pre_cross = cross_frames(group.pre_cross, self.pre, fps)
+        self.post_cross = cross_frames(group.post_cross, self.post, fps)
+        self.pre_shown = cross_shown(self.pre_cross)
+        self.post_shown = cross_shown(self.post_cross)
+
+        # Phase of each shape, advanced together for the whole group
+        self.phases = [shape.phase_engine(fps, frames=self.disp)
+                       for shape in group.shapes]
+        self.state = GroupState(self.phases, fpst)
+
+    def frames(self):
+        """Returns total number of frames the group is shown for."""
+        return self.pre + self.disp + self.post
+
+    def cross_after(self):
+        """Returns whether the cross is shown once the group is over.
+
+        The cross is always shown while a group is displayed, so this
+        does not depend on what came before the group.
+
+        """
+        if len(self.post_shown) == 0 or self.post_shown[-1] == None:
+            return True
+        return self.post_shown[-1]
+
+class Timeline:
+    """Schedule of a project run for a given order of groups."""
+
+    def __init__(self, proj, order, disp_ops):
+        """Compiles the schedule of a run of proj.
+
+        Waitscreens (group id -1) wait for user input, hence they do not
+        appear in the schedule and are not counted in its frames.
+
+        """
+        self.fps = proj.fps
+        self.pre = to_frames(proj.pre, self.fps)
+        self.post = to_frames(proj.post, self.fps)
+        self.pre_cross = cross_frames(proj.pre_cross, self.pre, self.fps)
+        self.post_cross = cross_frames(proj.post_cross, self.post, self.fps)
+        self.crosses = CrossColors(proj.cross_times, self.fps)
+        self.groups = {}
+        for gid in order:
+            if gid != -1 and gid not in self.groups:
+                self.groups[gid] = GroupSchedule(proj.groups[gid], self.fps,
+                                                 disp_ops['fpst'])
+        self.frames = (self.pre + self.post + disp_ops['repeats'] *
+                       sum([self.groups[gid].frames() for gid in order
+                            if gid != -1]))
+
+        # Whether the first colors only show on frames they flip to
+        self.photoburst = disp_ops['photoburst']
+
+        # First frame of each group within a repeat, for random access
+        self.order = [gid for gid in order if gid != -1]
+        self.repeats = disp_ops['repeats']
+        self.starts = []
+        self.period = 0
+        for gid in self.order:
+            self.starts.append(self.period)
+            self.period += self.groups[gid].frames()
+
+    def locate(self, count):
+        """Returns what is shown on frame count of an export, in O(1).
+
+        Returns a tuple (gid, disp_count, show_cross). gid is the id of
+        the group being shown or None during the pre and post periods of
+        the run, and disp_count counts the frames since the group's
+        shapes appeared, or is None if they are not shown. As in exports,
+        the run's own cross changes are not applied.
+
+        """
+        if count < 0 or count >= self.frames:
+            msg = 'frame {0} is not part of the run'.format(count)
+            raise IndexError(msg)
+        if count < self.pre:
+            return None, None, True
+        count -= self.pre
+        if count >= self.repeats * self.period:
+            if len(self.order) == 0:
+                return None, None, True
+            return None, None, self.groups[self.order[-1]].cross_after()
+        repeat, count = divmod(count, self.period)
+        # Groups without frames share their start with the next group
+        n = bisect.bisect_right(self.starts, count) - 1
+        gid = self.order[n]
+        sched = self.groups[gid]
+        count -= self.starts[n]
+        if count < sched.pre:
+            show = sched.pre_shown[count]
+            if show == None:
+                if n > 0:
+                    show = self.groups[self.order[n-1]].cross_after()
+                elif repeat > 0:
+                    show = self.groups[self.order[-1]].cross_after()
+                else:
+                    show = True
+            return gid, None, show
+        count -= sched.pre
+        if count < sched.disp:
+            return gid, count, True
+        count -= sched.disp
+        show = sched.post_shown[count]
+        if show == None:
+            show = True
+        return gid, None, show
+
+    def cross_color(self, count):
+        """Returns index of the cross color shown on frame count."""
+        return self.crosses.index(count)
@@ -1,6 +1,7 @@
 """Utility functions and classes."""
 
 import os
+import sys
 import time
 import math
 from decimal import *
@@ -69,15 +70,64 @@ def grouper(iterable, n, fillvalue=None):
     args = [iter(iterable)] * n
     return izip_longest(fillvalue=fillvalue, *args)
 
+def posix_monotonic():
+    """Returns a function reading CLOCK_MONOTONIC through ctypes, or None.
+
+    Python 2 has no monotonic clock of its own, and time.time jumps
+    whenever the system clock is adjusted, e.g. by NTP.
+
+    """
+    try:
+        import ctypes
+        import ctypes.util
+        libname = ctypes.util.find_library('rt') or \
+            ctypes.util.find_library('c')
+        clock_gettime = ctypes.CDLL(libname).clock_gettime
+    except (ImportError, OSError, AttributeError):
+        return None
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+    if sys.platform == 'darwin':
+        clock_id = 6
+    else:
+        clock_id = 1
+    spec = timespec()
+    ref = ctypes.byref(spec)
+    def monotonic():
+        clock_gettime(clock_id, ref)
+        return spec.tv_sec + spec.tv_nsec * 1e-9
+    if clock_gettime(clock_id, ref) != 0:
+        return None
+    return monotonic
+
+# Assigns appropriate clock function based on OS
+if hasattr(time, 'monotonic'):
+    monotonic = time.monotonic
+elif os.name == 'nt':
+    # Based on QueryPerformanceCounter, never goes back
+    monotonic = time.clock
+    monotonic()
+else:
+    monotonic = posix_monotonic() or time.time
+
+# Seconds before a deadline after which Timer.tick stops sleeping and spins
+SPIN_TIME = 0.002
+
 class Timer:
-    """High-res timer that should be cross-platform."""
-    def __init__(self):
-        # Assigns appropriate clock function based on OS
-        if os.name == 'nt':
-            self.clock = time.clock
-            self.clock()
-        elif os.name == 'posix':
-            self.clock = time.time
+    """High-res monotonic timer that should be cross-platform."""
+    def __init__(self, spin=SPIN_TIME):
+        """Creates a stopped timer.
+
+        spin -- seconds before a deadline during which tick busy-waits
+        instead of sleeping. Longer spins hit deadlines more accurately,
+        since sleeps may overshoot, but keep a core busy for longer.
+        None spins all the time, 0 only sleeps, so may return a little
+        before the deadline.
+
+        """
+        self.clock = monotonic
+        self.spin = spin
         self.running = False
         
     def start(self):
@@ -103,13 +153,28 @@ class Timer:
         self.running = True
         return self.start_time - old_start_time
 
+    def wait_until(self, deadline):
+        """Sleeps, then spins until the clock reaches deadline."""
+        if self.spin != None:
+            remaining = deadline - self.clock()
+            if remaining > self.spin:
+                time.sleep(remaining - self.spin)
+            if self.spin == 0:
+                return
+        while self.clock() < deadline:
+            pass
+
     def tick(self, fps):
-        """Limits loop to specified fps. To be placed at start of loop."""
-        fps = float(fps)
+        """Limits loop to specified fps. To be placed at start of loop.
+
+        Returns milliseconds since the last tick, before waiting, or None
+        on the first tick.
+
+        """
+        if not self.running:
+            self.start()
+            return None
         ret = self.elapsed()
-        if self.elapsed() != -1:
-            while self.elapsed() < (1.0 / fps):
-                pass
+        self.wait_until(self.start_time + 1.0 / float(fps))
         self.start()
-        if ret != -1:
-            return ret * 1000
+        return ret * 1000
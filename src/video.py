@@ -0,0 +1,174 @@
+"""Streams exported frames into a single video file.
+
+Appending every frame to one file with large buffered writes avoids the
+per-file overhead of exporting one image per frame, so exports of any
+length run at close to disk bandwidth.
+
+Classes:
+RawFile -- Headerless RGB24 frames, one after another.
+Y4MFile -- YUV4MPEG2 stream with 4:4:4 8-bit frames.
+APNGFile -- Animated PNG, storing each run of identical frames once.
+
+"""
+
+import struct
+from fractions import Fraction
+
+try:
+    import numpy
+    available = True
+except ImportError:
+    available = False
+
+import pngfile
+
+# Size of the write buffer of video files in bytes
+BUFFER_SIZE = 2**22
+
+class RawFile:
+    """Headerless RGB24 frames, one after another.
+
+    Can be read with e.g. ffmpeg -f rawvideo -pix_fmt rgb24 -s WxH.
+
+    """
+
+    def __init__(self, path, res, fps):
+        """Creates the file and writes its header, if any.
+
+        res -- width and height of the frames in pixels
+
+        fps -- frames per second of the video
+
+        """
+        self.res = tuple(res)
+        self.fps = fps
+        self.file = open(path, 'wb', BUFFER_SIZE)
+        self.file.write(self.header())
+
+    def header(self):
+        """Returns the header of the file."""
+        return ''
+
+    def write_frame(self, data):
+        """Appends a frame of RGB bytes, rows from the top."""
+        self.file.write(data)
+
+    def close(self):
+        """Flushes and closes the file."""
+        self.file.close()
+
+class Y4MFile(RawFile):
+    """YUV4MPEG2 stream with 4:4:4 8-bit frames.
+
+    Frames are converted from RGB with the BT.601 matrix to limited range
+    YCbCr, which is what players and encoders assume by default.
+
+    """
+
+    def __init__(self, path, res, fps):
+        if not available:
+            msg = 'Y4M export requires NumPy'
+            raise NotImplementedError(msg)
+        RawFile.__init__(self, path, res, fps)
+
+    def header(self):
+        rate = Fraction(self.fps)
+        return 'YUV4MPEG2 W{0} H{1} F{2}:{3} Ip A1:1 C444\n'.\
+            format(self.res[0], self.res[1], rate.numerator,
+                   rate.denominator)
+
+    def write_frame(self, data):
+        rgb = numpy.fromstring(data, dtype=numpy.uint8).\
+            reshape(-1, 3).astype(numpy.int32)
+        r, g, b = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+        y = ((66 * r + 129 * g + 25 * b + 128) >> 8) + 16
+        u = ((-38 * r - 74 * g + 112 * b + 128) >> 8) + 128
+        v = ((112 * r - 94 * g - 18 * b + 128) >> 8) + 128
+        planes = numpy.concatenate([y, u, v]).astype(numpy.uint8)
+        self.file.write('FRAME\n')
+        self.file.write(planes.tostring())
+
+class APNGFile(RawFile):
+    """Animated PNG, storing each run of identical frames once.
+
+    A run of identical frames becomes a single APNG frame, shown for as
+    long as the whole run, so a stimulus that changes a few times per
+    second only needs a few frames per second. A frame is compressed
+    once the next different frame arrives, and the total number of
+    frames is filled in when the file is closed.
+
+    """
+
+    # Delays are stored as 16-bit fractions of a second
+    MAX_DELAY = 0xffff
+
+    def __init__(self, path, res, fps):
+        self.frames = 0
+        self.sequence = 0
+        self.last = None
+        self.run = 0
+        RawFile.__init__(self, path, res, fps)
+
+    def header(self):
+        head = pngfile.SIGNATURE + pngfile.header(*self.res)
+        self._actl_pos = len(head)
+        return head + self._actl()
+
+    def _actl(self):
+        """Returns animation control chunk, with frames looping forever."""
+        return pngfile.chunk('acTL', struct.pack('>II', self.frames, 0))
+
+    def _delay(self, run):
+        """Returns frames and delay of the first APNG frame of a run.
+
+        Runs too long for a 16-bit delay are split into several frames.
+
+        """
+        frames = run
+        while True:
+            delay = (Fraction(frames) / Fraction(self.fps)).\
+                limit_denominator(self.MAX_DELAY)
+            if delay.numerator <= self.MAX_DELAY:
+                return frames, delay
+            frames = (frames + 1) // 2
+
+    def _write_run(self):
+        """Writes the current run of identical frames, if any."""
+        if self.last == None:
+            return
+        data = pngfile.compress(self.res[0], self.res[1], self.last)
+        run = self.run
+        while run > 0:
+            frames, delay = self._delay(run)
+            fctl = struct.pack('>IIIIIHHBB', self.sequence,
+                               self.res[0], self.res[1], 0, 0,
+                               delay.numerator, delay.denominator, 0, 0)
+            self.file.write(pngfile.chunk('fcTL', fctl))
+            self.sequence += 1
+            if self.frames == 0:
+                # The first frame doubles as the still image
+                self.file.write(pngfile.chunk('IDAT', data))
+            else:
+                self.file.write(pngfile.chunk('fdAT',
+                                              struct.pack('>I', self.sequence)
+                                              + data))
+                self.sequence += 1
+            self.frames += 1
+            run -= frames
+
+    def write_frame(self, data):
+        if data == self.last:
+            self.run += 1
+            return
+        self._write_run()
+        self.last = data
+        self.run = 1
+
+    def close(self):
+        self._write_run()
+        self.file.write(pngfile.chunk('IEND', ''))
+        self.file.seek(self._actl_pos)
+        self.file.write(self._actl())
+        self.file.close()
+
+FORMATS = {'rgb': RawFile, 'y4m': Y4MFile, 'apng': APNGFile}
@@ -0,0 +1,37 @@
+"""Helpers shared by the checkergen tests.
+
+Run the tests from the top directory with:
+python -m unittest discover -s tests
+
+Tests that draw need an OpenGL context, which is taken from a hidden
+window, and are skipped where no window can be created.
+
+"""
+
+import os
+import sys
+import unittest
+
+TOP = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SRC = os.path.join(TOP, 'src')
+EXAMPLE = os.path.join(TOP, 'example.ckg')
+
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+import pyglet
+# Importing pyglet.gl must not require a display
+pyglet.options['shadow_window'] = False
+
+_window = None
+
+def gl_context():
+    """Makes an OpenGL context current, or skips the calling test."""
+    global _window
+    if pyglet.gl.current_context != None:
+        return
+    try:
+        _window = pyglet.window.Window(visible=False)
+    except Exception:
+        raise unittest.SkipTest('no OpenGL context available')
+    _window.switch_to()
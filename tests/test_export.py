@@ -0,0 +1,281 @@
+"""Tests of exporting projects with the software engine."""
+
+import os
+import sys
+import copy
+import shutil
+import subprocess
+import tempfile
+import unittest
+from decimal import Decimal
+
+import support
+
+import core
+import raster
+import graphics
+import partition
+import trigger
+
+# Crosses with the pixels GL_LINES fills for them in llvmpipe, as
+# (pos, dims, thick), then the rows and columns of the horizontal line
+# and the columns and rows of the vertical line, last ones excluded
+CROSSES = [(((32, 24), (20, 20), 2.0), (23, 25, 22, 42), (31, 33, 14, 34)),
+           (((32.5, 24.5), (10.5, 7), 3.0), (23, 26, 27, 37), (31, 34, 21, 28)),
+           (((20.75, 23.25), (15, 9.5), 1.0), (23, 24, 13, 28), (20, 21, 18, 28))]
+
+def export_files(path):
+    """Returns the contents of all files exported into path, by name."""
+    return dict([(name, open(os.path.join(path, name), 'rb').read())
+                 for name in os.listdir(path)])
+
+class SoftwareExportTest(unittest.TestCase):
+
+    def setUp(self):
+        if not raster.available:
+            self.skipTest('NumPy is not installed')
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_no_gl_models(self):
+        proj = core.CkgProj(path=support.EXAMPLE)
+        proj.export(expo_dir=self.dir, expo_dur=core.to_decimal('0.1'),
+                    engine='software', folder=False)
+        self.assertEqual(len(os.listdir(self.dir)), 6)
+        for group in proj.groups:
+            for shape in group.shapes:
+                self.assertFalse(hasattr(shape, '_batch'))
+
+    def test_cli_without_display(self):
+        env = dict(os.environ)
+        env.pop('DISPLAY', None)
+        script = os.path.join(support.TOP, 'checkergen.py')
+        process = subprocess.Popen([sys.executable, script, '--engine',
+                                    'software', '-e', '0.1', '--dir',
+                                    self.dir, support.EXAMPLE],
+                                   cwd=support.TOP, env=env,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+        self.assertEqual(process.returncode, 0, output)
+        frames = os.listdir(os.path.join(self.dir, 'example-anim'))
+        self.assertEqual(len(frames), 6)
+
+    def test_no_profile(self):
+        proj = core.CkgProj(path=support.EXAMPLE)
+        self.assertRaises(ValueError, proj.export, expo_dir=self.dir,
+                          expo_dur=core.to_decimal('0.1'), engine='software',
+                          profile=True)
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_trigger_every_frame(self):
+        sent = []
+        saved = (trigger.available['parallel'], trigger.init, trigger.send,
+                 trigger.quit)
+        trigger.available['parallel'] = True
+        trigger.init = lambda trigser, trigpar: None
+        trigger.send = lambda trigser, trigpar, code: sent.append(code)
+        trigger.quit = lambda trigser, trigpar: None
+        try:
+            proj = core.CkgProj(path=support.EXAMPLE)
+            proj.export(expo_dir=self.dir, expo_dur=core.to_decimal('0.1'),
+                        engine='software', folder=False, trigpar=True)
+        finally:
+            (trigger.available['parallel'], trigger.init, trigger.send,
+             trigger.quit) = saved
+        # The same code is sent again on each frame
+        self.assertEqual(len(sent), 6)
+        self.assertEqual(len(set(sent)), 1)
+
+    def test_photoburst(self):
+        proj = core.CkgProj(path=support.EXAMPLE)
+        proj.groups[0].pre = 0
+        plain = os.path.join(self.dir, 'plain')
+        linked = os.path.join(self.dir, 'linked')
+        for path, dedupe in [(plain, None), (linked, 'link')]:
+            os.mkdir(path)
+            proj.export(expo_dir=path, expo_dur=core.to_decimal('0.5'),
+                        engine='software', folder=False, photoburst=True,
+                        dedupe=dedupe)
+        frames = export_files(plain)
+        self.assertEqual(export_files(linked), frames)
+        # Frames drawn one by one show the same phases
+        sched = proj.compile(photoburst=True)
+        for n in [0, 1, 7, 8, 15, 29]:
+            canvas = proj.render_frame(n, sched)
+            canvas.save(os.path.join(self.dir, 'frame.png'))
+            self.assertEqual(open(os.path.join(self.dir, 'frame.png'),
+                                  'rb').read(),
+                             frames['example{0:02d}.png'.format(n)])
+        unburst = proj.render_frame(1, proj.compile())
+        self.assertFalse(unburst.tostring() ==
+                         proj.render_frame(1, sched).tostring())
+
+    def test_photoburst_matches_gl(self):
+        support.gl_context()
+        if not graphics.have_framebuffers():
+            self.skipTest('framebuffers not available')
+        proj = core.CkgProj(path=support.EXAMPLE)
+        proj.groups[0].pre = 0
+        for engine in ['gl', 'software']:
+            os.mkdir(os.path.join(self.dir, engine))
+            proj.export(expo_dir=os.path.join(self.dir, engine),
+                        expo_dur=core.to_decimal('0.2'), engine=engine,
+                        folder=False, photoburst=True, readback='sync')
+        self.assertEqual(export_files(os.path.join(self.dir, 'software')),
+                         export_files(os.path.join(self.dir, 'gl')))
+
+class RandomAccessTest(unittest.TestCase):
+
+    def setUp(self):
+        if not raster.available:
+            self.skipTest('NumPy is not installed')
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def project(self):
+        """Returns the example with two groups and crosses that change."""
+        proj = core.CkgProj(path=support.EXAMPLE)
+        proj.pre = proj.post = Decimal('0.1')
+        first = proj.groups[0]
+        second = copy.deepcopy(first)
+        first.pre, first.disp, first.post = '0.1', '0.25', '0.1'
+        first.pre_cross = [(Decimal(0), False), (Decimal('0.05'), True)]
+        second.pre, second.disp, second.post = 0, '0.2', '0.15'
+        second.post_cross = [(Decimal(0), True), (Decimal('0.1'), False)]
+        second.shapes[0].phase = 90
+        proj.groups.append(second)
+        return proj
+
+    def test_matches_export(self):
+        proj = self.project()
+        # Waitscreens take no frames, the groups are shown twice
+        keywords = dict(order=[0, -1, 1], repeats=2)
+        proj.export(expo_dir=self.dir, expo_dur=Decimal(100),
+                    engine='software', folder=False, **keywords)
+        frames = export_files(self.dir)
+        sched = proj.compile(**keywords)
+        self.assertEqual(len(frames), sched.frames)
+        path = os.path.join(self.dir, 'frame.png')
+        canvas = None
+        # Frames in pre, post, each group and both repeats, in any order
+        for n in [107, 0, 64, 5, 6, 11, 12, 17, 18, 33, 38, 39, 50, 51, 59,
+                  54, 60, 61, 73, 89, 101, 102, 30, 95]:
+            canvas = proj.render_frame(n, sched, canvas)
+            canvas.save(path)
+            name = 'example{0:03d}.png'.format(n)
+            self.assertEqual(open(path, 'rb').read(), frames[name], name)
+
+class ParallelExportTest(unittest.TestCase):
+
+    def setUp(self):
+        if not raster.available:
+            self.skipTest('NumPy is not installed')
+        if not partition.available:
+            self.skipTest('fork() is not available')
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def export(self, jobs):
+        """Returns the files of a software export made by jobs processes."""
+        path = os.path.join(self.dir, str(jobs))
+        os.mkdir(path)
+        proj = core.CkgProj(path=support.EXAMPLE)
+        proj.groups[0].pre = '0.05'
+        proj.export(expo_dir=path, expo_dur=Decimal('0.5'),
+                    engine='software', folder=False, jobs=jobs)
+        return export_files(path)
+
+    def test_matches_one_job(self):
+        frames = self.export(1)
+        self.assertEqual(len(frames), 30)
+        self.assertEqual(self.export(3), frames)
+
+    def test_failed_job(self):
+        save = raster.Canvas.save
+        def fail(canvas, path):
+            if path.endswith('example17.png'):
+                raise IOError('disk full')
+            save(canvas, path)
+        raster.Canvas.save = fail
+        try:
+            self.assertRaises(IOError, self.export, 3)
+        finally:
+            raster.Canvas.save = save
+
+    def test_cli_failed_job(self):
+        # The job exporting frame 3 cannot write over a directory
+        os.makedirs(os.path.join(self.dir, 'example-anim', 'example3.png'))
+        script = os.path.join(support.TOP, 'checkergen.py')
+        process = subprocess.Popen([sys.executable, script, '--engine',
+                                    'software', '--jobs', '3', '-e', '0.1',
+                                    '--dir', self.dir, support.EXAMPLE],
+                                   cwd=support.TOP, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+        self.assertEqual(process.returncode, 1, output)
+        self.assertTrue('error: export of frames 2 to 3 failed' in output,
+                        output)
+
+class CrossTest(unittest.TestCase):
+
+    res = (64, 48)
+
+    def setUp(self):
+        if not raster.available:
+            self.skipTest('NumPy is not installed')
+
+    def draw(self, args):
+        """Returns the mask of pixels of a cross drawn in software."""
+        canvas = raster.Canvas(self.res)
+        canvas.draw_cross(graphics.Cross(*args, col=(255, 0, 0)))
+        return canvas.pixels[:, :, 0] != 0
+
+    def test_golden(self):
+        for args, horizontal, vertical in CROSSES:
+            expected = raster.numpy.zeros(self.res[::-1], dtype=bool)
+            j0, j1, i0, i1 = horizontal
+            expected[j0:j1, i0:i1] = True
+            i0, i1, j0, j1 = vertical
+            expected[j0:j1, i0:i1] = True
+            self.assertTrue((self.draw(args) == expected).all(), args)
+
+    def test_matches_gl(self):
+        support.gl_context()
+        if not graphics.have_framebuffers():
+            self.skipTest('framebuffers not available')
+        fbo = graphics.Framebuffer(graphics.pyglet.image.Texture.create(
+                *self.res))
+        try:
+            for x in [32, 32.5, 31.25, 20.75]:
+                for y in [24, 24.5, 23.25]:
+                    for dims in [(20, 20), (21, 15), (10.5, 7)]:
+                        for thick in [1.0, 2.0, 2.5, 3.0, 4.0]:
+                            args = ((x, y), dims, thick)
+                            self.assertTrue((self.draw_gl(fbo, args) ==
+                                             self.draw(args)).all(), args)
+        finally:
+            fbo.delete()
+
+    def draw_gl(self, fbo, args):
+        """Returns the mask of pixels of a cross drawn with GL_LINES."""
+        fbo.start_render()
+        graphics.set_clear_color()
+        fbo.clear()
+        graphics.Cross(*args, col=(255, 0, 0)).draw()
+        data = (graphics.ctypes.c_ubyte * (self.res[0] * self.res[1] * 3))()
+        graphics.glPixelStorei(graphics.GL_PACK_ALIGNMENT, 1)
+        graphics.glReadPixels(0, 0, self.res[0], self.res[1], graphics.GL_RGB,
+                              graphics.GL_UNSIGNED_BYTE, data)
+        fbo.end_render()
+        pixels = raster.numpy.frombuffer(data, dtype=raster.numpy.uint8)
+        return pixels.reshape(self.res[1], self.res[0], 3)[:, :, 0] != 0
+
+if __name__ == '__main__':
+    unittest.main()
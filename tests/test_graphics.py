@@ -0,0 +1,99 @@
+"""Tests of building and drawing checkerboards with OpenGL."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import support
+
+import core
+import geometry
+import graphics
+
+class CheckerBoardTest(unittest.TestCase):
+
+    def setUp(self):
+        support.gl_context()
+
+    def test_build_with_numpy(self):
+        if not geometry.available:
+            self.skipTest('NumPy is not installed')
+        board = core.CheckerBoard(dims=(4, 3), init_unit=(10, 20),
+                                  end_unit=(30, 10), position=(100, 50))
+        board.compute()
+        vertex_list = board._vertex_list
+        self.assertEqual(len(vertex_list.vertices), vertex_list.get_size() * 2)
+        self.assertEqual(list(vertex_list.colors),
+                         board._col_arrays[0].tolist())
+
+    def test_flip_phases(self):
+        board = core.CheckerBoard(dims=(3, 3), freq=30)
+        board.compute()
+        for n in [0, 1, 1, 0, 1]:
+            board.draw_phase(n)
+            self.assertEqual(list(board._vertex_list.colors),
+                             list(board._col_arrays[n]))
+        # Animate through several flips at 60 fps
+        board.reset()
+        for count in range(6):
+            board.draw()
+            n = board._engine.bit(board._count)
+            self.assertEqual(n, count % 2)
+            self.assertEqual(list(board._vertex_list.colors),
+                             list(board._col_arrays[n]))
+            board.update(60)
+
+    def test_load_project(self):
+        proj = core.CkgProj(path=support.EXAMPLE)
+        for group in proj.groups:
+            for shape in group.shapes:
+                shape.draw_phase(0)
+
+class ShaderTest(unittest.TestCase):
+
+    def setUp(self):
+        support.gl_context()
+        if not graphics.have_shaders():
+            self.skipTest('shaders not available')
+
+    def reset_program(self):
+        graphics._checker_program = None
+        graphics._checker_error = None
+
+    def export(self, shaders):
+        """Returns the images of a short export as strings."""
+        path = tempfile.mkdtemp()
+        try:
+            proj = core.CkgProj(path=support.EXAMPLE)
+            proj.export(expo_dir=path, expo_dur=core.to_decimal('0.1'),
+                        folder=False, readback='sync', shaders=shaders)
+            return [open(os.path.join(path, name), 'rb').read()
+                    for name in sorted(os.listdir(path))]
+        finally:
+            shutil.rmtree(path)
+
+    def test_matches_mesh(self):
+        if not graphics.have_framebuffers():
+            self.skipTest('framebuffers not available')
+        self.reset_program()
+        self.assertEqual(self.export(True), self.export(False))
+        self.assertNotEqual(graphics._checker_program, None)
+
+    def test_fallback(self):
+        frag = graphics.CHECKER_FRAG
+        graphics.CHECKER_FRAG = 'not a shader'
+        self.reset_program()
+        try:
+            board = core.CheckerBoard()
+            board.draw_phase(1, shaders=True)
+            self.assertEqual(list(board._vertex_list.colors),
+                             list(board._col_arrays[1]))
+            self.assertRaises(graphics.ShaderError,
+                              graphics.get_checker_program)
+        finally:
+            graphics.CHECKER_FRAG = frag
+            self.reset_program()
+
+if __name__ == '__main__':
+    unittest.main()
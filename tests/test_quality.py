@@ -0,0 +1,48 @@
+"""Tests of detecting dropped frames."""
+
+import unittest
+
+import support
+
+import quality
+
+class FakeClock:
+    """Clock that only moves when told to."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class DropDetectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.drops = quality.DropDetector()
+        self.drops.clock = self.clock
+        for n in range(quality.WARMUP_FRAMES + 1):
+            self.clock.now += 0.01
+            self.drops.warmup()
+        self.drops.start()
+
+    def test_setup_not_dropped(self):
+        # Setup between warm-up and the run takes many refreshes
+        self.clock.now += 0.5
+        self.drops.begin()
+        for n in range(10):
+            self.clock.now += 0.01
+            self.drops.frame(0, None)
+        self.assertEqual(self.drops.drops, [])
+
+    def test_late_frame(self):
+        self.drops.begin()
+        for duration in [0.01, 0.03, 0.01]:
+            self.clock.now += duration
+            self.drops.frame(1, (0, 1))
+        self.assertEqual(len(self.drops.drops), 1)
+        self.assertEqual(self.drops.drops[0][:3], (1, 1, (0, 1)))
+        self.assertEqual(self.drops.by_group(), {1: 2})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+"""Tests of storing and streaming run logs."""
+
+import os
+import csv
+import shutil
+import tempfile
+import unittest
+import cStringIO
+
+import support
+
+import runlog
+
+FRAMES = [(0.0, 0.01, 5, 0.0002, runlog.MISSING, runlog.MISSING),
+          (0.01, 0.01, 0, runlog.MISSING, runlog.MISSING, runlog.MISSING),
+          (runlog.MISSING, 0.02, 0, runlog.MISSING, 1.5, -2.0)]
+
+ROWS = [['0.0', '0.01', '5', '0.0002', '', ''],
+        ['0.01', '0.01', '', '', '', ''],
+        ['', '0.02', '', '', '1.5', '-2.0']]
+
+class RunLogTest(unittest.TestCase):
+
+    def test_grow(self):
+        log = runlog.RunLog(1)
+        for n in range(runlog.MIN_FRAMES * 2 + 1):
+            log.append(*FRAMES[n % len(FRAMES)])
+        self.assertEqual(log.size, runlog.MIN_FRAMES * 4)
+        rows = list(log.rows())
+        self.assertEqual(len(rows), runlog.MIN_FRAMES * 2 + 1)
+        self.assertEqual([[str(v) for v in row] for row in rows[-3:]], ROWS)
+
+    def test_untracked(self):
+        # The eyetracker gives '' for eye positions while the eye is lost
+        log = runlog.RunLog(1)
+        log.append(0.0, 0.01, 0, runlog.MISSING, '', '')
+        log.append(0.01, 0.01, 0, runlog.MISSING, None, 3.25)
+        self.assertEqual(list(log.rows()), [[0.0, 0.01, '', '', '', ''],
+                                            [0.01, 0.01, '', '', '', 3.25]])
+
+    def test_single_precision(self):
+        log = runlog.RunLog(1)
+        log.append(3600.0001, 1 / 60.0, 65535, 0.0002, 12.3, -0.1)
+        self.assertEqual([str(v) for v in list(log.rows())[0]],
+                         ['3600.0001', '0.01666667', '65535', '0.0002',
+                          '12.3', '-0.1'])
+
+class LogStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'run.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read(self):
+        with open(self.path, 'rb') as logfile:
+            return list(csv.reader(logfile, dialect='excel-tab'))
+
+    def test_stream(self):
+        stream = runlog.LogStream(self.path, [['header']], interval=0.01)
+        for frame in FRAMES:
+            stream.append(*frame)
+        stream.close()
+        self.assertEqual(self.read(), [['header'], runlog.COLUMNS] + ROWS)
+
+    def test_untracked(self):
+        stream = runlog.LogStream(self.path, interval=0.01)
+        stream.append(0.0, 0.01, 0, runlog.MISSING, '', None)
+        stream.close()
+        self.assertEqual(self.read()[1:], [['0.0', '0.01', '', '', '', '']])
+
+    def test_copy(self):
+        stream = runlog.LogStream(self.path, [['header']], interval=0.01)
+        log = runlog.RunLog(1)
+        for frame in FRAMES:
+            stream.append(*frame)
+            log.append(*frame)
+        stream.close()
+        copied = cStringIO.StringIO()
+        stream.copy(copied)
+        written = cStringIO.StringIO()
+        writer = csv.writer(written, dialect='excel-tab')
+        writer.writerow(runlog.COLUMNS)
+        writer.writerows(log.rows())
+        self.assertEqual(copied.getvalue(), written.getvalue())
+
+    def test_writer_error(self):
+        stream = runlog.LogStream(self.path, interval=0.01)
+        stream.file.close()
+        stream.append(*FRAMES[0])
+        stream.thread.join(5)
+        self.assertFalse(stream.thread.is_alive())
+        self.assertRaises(ValueError, stream.append, *FRAMES[1])
+        self.assertRaises(ValueError, stream.close)
+
+    def test_no_header(self):
+        runlog.LogStream(self.path).close()
+        self.assertEqual(self.read(), [runlog.COLUMNS])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+"""Tests of compiling runs into frame schedules."""
+
+import unittest
+from decimal import Decimal
+
+import support
+
+import core
+import timeline
+
+def decimal_color(count, cross_times, fps):
+    """Returns the cross color index as display used to work it out."""
+    return int(not (count % (sum(cross_times) * fps) <
+                    cross_times[0] * fps))
+
+def decimal_phases(phase, freq, fps, n):
+    """Returns bits and flips of n frames as the Decimal phase gave them."""
+    cur = prev = phase
+    bits, flipped = [], []
+    for count in range(n):
+        if count > 0:
+            prev = cur
+            cur += 180 / Decimal(round(fps / (freq * 2)))
+            if cur >= 360:
+                cur %= 360
+        cur %= 360
+        bits.append(int(cur // 180))
+        flipped.append(int(cur // 180) != int(prev // 180))
+    return bits, flipped
+
+class PhaseTest(unittest.TestCase):
+
+    def check(self, phase, freq, fps, n=1000):
+        """Checks that flips happen on the same frames as they used to."""
+        bits, flipped = decimal_phases(phase, freq, fps, n)
+        engine = timeline.make_phase(phase, freq, fps)
+        self.assertEqual([engine.bit(c) for c in range(n)], bits)
+        self.assertEqual([engine.flipped(c) for c in range(n)], flipped)
+        frames = [c for c in range(n) if flipped[c]]
+        engine = timeline.make_phase(phase, freq, fps, frames=n)
+        self.assertEqual([engine.flip_frame(m)
+                          for m in range(1, len(frames) + 1)], frames)
+        self.assertEqual([engine.bit(c) for c in reversed(range(n))],
+                         bits[::-1])
+        return engine
+
+    def test_example(self):
+        proj = core.CkgProj(path=support.EXAMPLE)
+        for group in proj.groups:
+            for shape in group.shapes:
+                self.check(shape.phase, shape.freq, proj.fps)
+
+    def test_rounded(self):
+        # Half periods of 7, 13, 17, 28 and 34 frames at 60 fps
+        for phase, freq in [(0, '4.3'), (0, '2.3'), (180, '1.75'),
+                            (45, '1.07'), (0, '0.88')]:
+            phase, freq, fps = Decimal(phase), Decimal(freq), Decimal(60)
+            engine = self.check(phase, freq, fps)
+            self.assertTrue(isinstance(engine, timeline.DecimalPhase))
+            # Flips are all worked out in advance
+            self.assertEqual(engine._count, 999)
+            self.assertEqual(engine.flip_frame(len(engine.frames) + 1), None)
+            exact = timeline.Phase(phase, freq, fps)
+            self.assertNotEqual([engine.flip_frame(m) for m in range(1, 30)],
+                                [exact.flip_frame(m) for m in range(1, 30)])
+
+    def test_group(self):
+        phases = [timeline.make_phase(Decimal(phase), Decimal(freq),
+                                      Decimal(60), frames=300)
+                  for phase, freq in [(0, '4.3'), (90, 2), (45, '1.07')]]
+        state = timeline.GroupState(phases, fpst=2)
+        for count in range(300):
+            state.advance(count)
+            self.assertEqual(state.bits, [p.bit(count) for p in phases])
+            self.assertEqual(state.flips, [p.flips(count) for p in phases])
+        state.seek(299)
+        self.assertEqual(state.flips, [p.flips(299) for p in phases])
+
+class CrossColorsTest(unittest.TestCase):
+
+    def check(self, cross_times, fps, counts):
+        crosses = timeline.CrossColors(cross_times, fps)
+        for count in counts:
+            self.assertEqual(crosses.index(count),
+                             decimal_color(count, cross_times, fps))
+        return crosses
+
+    def test_table(self):
+        crosses = self.check((Decimal('0.75'), Decimal('0.25')), Decimal(60),
+                             range(200))
+        self.assertEqual(crosses.period, 60)
+        self.assertEqual(len(crosses.table), 60)
+
+    def test_long_period(self):
+        # Millisecond times make the period millions of frames long
+        cross_times = (Decimal('1000.001'), Decimal(1))
+        crosses = self.check(cross_times, Decimal(60),
+                             range(59990, 60100) + [10**7, 10**9 + 7])
+        self.assertTrue(crosses.period > timeline.MAX_CROSS_FRAMES)
+        self.assertEqual(crosses.table, None)
+
+    def test_infinite(self):
+        crosses = timeline.CrossColors((Decimal('Infinity'), Decimal(1)),
+                                       Decimal(60))
+        self.assertEqual([crosses.index(c) for c in [0, 10**9]], [0, 0])
+        crosses = timeline.CrossColors((Decimal('3600.0001'),
+                                        Decimal('Infinity')), Decimal(60))
+        self.assertEqual(crosses.table, None)
+        self.assertEqual([crosses.index(c) for c in [0, 216000, 216001]],
+                         [0, 0, 1])
+
+class TimelineTest(unittest.TestCase):
+
+    def test_negative_durations(self):
+        proj = core.CkgProj(path=support.EXAMPLE)
+        proj.pre = -1
+        proj.post = Decimal('-0.5')
+        group = proj.groups[0]
+        group.pre, group.post = -2, -1
+        sched = proj.compile(order=[0])
+        self.assertEqual((sched.pre, sched.post), (0, 0))
+        self.assertEqual((sched.groups[0].pre, sched.groups[0].post), (0, 0))
+        self.assertEqual(sched.frames, group.disp * proj.fps)
+        self.assertEqual(sched.locate(0), (0, 0, True))
+        group.disp = -10
+        self.assertEqual(proj.compile(order=[0]).frames, 0)
+
+if __name__ == '__main__':
+    unittest.main()
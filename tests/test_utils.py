@@ -0,0 +1,52 @@
+"""Tests of utility functions and classes."""
+
+import time
+import unittest
+
+import support
+
+import utils
+
+class FakeClock:
+    """Clock that moves on a little on every read, and with sleeps."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.reads = 0
+
+    def __call__(self):
+        self.reads += 1
+        self.now += 0.001
+        return self.now
+
+    def sleep(self, seconds):
+        # Sleeps may return a little early
+        self.now += seconds * 0.9
+
+class TimerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.sleep = time.sleep
+        time.sleep = self.clock.sleep
+
+    def tearDown(self):
+        time.sleep = self.sleep
+
+    def wait(self, spin):
+        timer = utils.Timer(spin)
+        timer.clock = self.clock
+        timer.wait_until(1.0)
+
+    def test_only_sleep(self):
+        self.wait(0)
+        self.assertEqual(self.clock.reads, 1)
+        self.assertTrue(self.clock.now < 1.0)
+
+    def test_spin(self):
+        self.wait(0.002)
+        self.assertTrue(self.clock.now >= 1.0)
+        self.assertTrue(self.clock.reads > 1)
+
+if __name__ == '__main__':
+    unittest.main()